@@ -1,120 +1,1488 @@
+from array import array
+import asyncio
+import bisect
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+import heapq
+import itertools
+import math
+import random
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class PointArray:
+    # leaf points packed as x0, y0, x1, y1, ... in one array('d') instead of a list of tuples
+    __slots__ = ('coords',)
+
+    def __init__(self, points=()):
+        self.coords = array('d')
+        for p in points:
+            self.coords.extend((p[0], p[1]))
+
+    def __len__(self):
+        return len(self.coords) // 2
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return list(self)[i]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('point index out of range')
+        return (self.coords[2 * i], self.coords[2 * i + 1])
+
+    def __iter__(self):
+        c = self.coords
+        return zip(c[0::2], c[1::2])
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __setitem__(self, i, point):
+        if i < 0:
+            i += len(self)
+        self.coords[2 * i:2 * i + 2] = array('d', (point[0], point[1]))
+
+    def __delitem__(self, i):
+        if i < 0:
+            i += len(self)
+        del self.coords[2 * i:2 * i + 2]
+
+    def append(self, point):
+        self.coords.extend((point[0], point[1]))
+
+    def insert(self, i, point):
+        self.coords[2 * i:2 * i] = array('d', (point[0], point[1]))
+
+    def remove(self, point):
+        for i, p in enumerate(self):
+            if p == point:
+                del self.coords[2 * i:2 * i + 2]
+                return
+        raise ValueError(f'{point} not in leaf')
+
+
 class Node:
-    def __init__(self, mbr=None, entries=None, is_leaf=False, parent=None):
+    __slots__ = ('mbr', 'entries', 'is_leaf', 'parent', 'arrays', 'payloads', 'sizes', 'keys')
+
+    def __init__(self, mbr=None, entries=None, is_leaf=False, parent=None, payloads=None):
         self.mbr = mbr or (float('inf'), float('inf'), float('-inf'), float('-inf'))  # (xmin, ymin, xmax, ymax)
         self.entries = entries or []
         self.is_leaf = is_leaf
         self.parent = parent
+        self.arrays = None  # packed coordinates for vectorized mode, built on first use
+        self.payloads = payloads  # leaf of a payload tree: one payload per entry, same order
+        self.sizes = None  # (area, margin) of the mbr, computed on first use
+        self.keys = None  # HilbertRTree: Hilbert value of each entry, or the largest one below each child
 
     def update_mbr(self, mbr):
-        xmin, ymin, xmax, ymax = self.mbr
-        self.mbr = (min(xmin, mbr[0]), min(ymin, mbr[1]), max(xmax, mbr[2]), max(ymax, mbr[3]))
+        # widen to cover mbr, False if it already did
+        if len(mbr) == 4:
+            xmin, ymin, xmax, ymax = self.mbr
+            if xmin <= mbr[0] and ymin <= mbr[1] and mbr[2] <= xmax and mbr[3] <= ymax:
+                return False
+            self.mbr = (min(xmin, mbr[0]), min(ymin, mbr[1]), max(xmax, mbr[2]), max(ymax, mbr[3]))
+        else:
+            # (min_0 .. min_d-1, max_0 .. max_d-1) of an NDRTree
+            d = len(mbr) // 2
+            grown = tuple(map(min, self.mbr[:d], mbr[:d])) + tuple(map(max, self.mbr[d:], mbr[d:]))
+            if grown == self.mbr:
+                return False
+            self.mbr = grown
+        self.touch()
+        return True
+
+    def touch(self):
+        # entries or mbr changed: drop our packed arrays and cached sizes, and the parent's arrays, which hold our mbr
+        self.arrays = None
+        self.sizes = None
+        if self.parent is not None:
+            self.parent.arrays = None
+
+    def packed(self):
+        # leaf: (n, 2) point coordinates, internal: (n, 4) child MBRs
+        if self.arrays is None:
+            if isinstance(self.entries, PointArray):
+                self.arrays = np.array(self.entries.coords, dtype=float).reshape(-1, 2)
+            elif self.is_leaf and self.entries and isinstance(self.entries[0][0], tuple):
+                # (mbr, payload) records of a RectRTree
+                self.arrays = np.array([e[0] for e in self.entries], dtype=float).reshape(-1, 4)
+            elif self.is_leaf:
+                d = len(self.mbr) // 2
+                self.arrays = np.array([e[:d] for e in self.entries], dtype=float).reshape(-1, d)
+            else:
+                self.arrays = np.array([child.mbr for child in self.entries], dtype=float).reshape(-1, len(self.mbr))
+        return self.arrays
+
+    def measure(self):
+        if len(self.mbr) == 4:
+            xmin, ymin, xmax, ymax = self.mbr
+            self.sizes = ((xmax - xmin) * (ymax - ymin), (xmax - xmin) + (ymax - ymin))
+        else:
+            d = len(self.mbr) // 2
+            sides = [hi - lo for lo, hi in zip(self.mbr[:d], self.mbr[d:])]
+            self.sizes = (math.prod(sides), sum(sides))
+        return self.sizes
 
     def area(self):
-        xmin, ymin, xmax, ymax = self.mbr
-        return (xmax - xmin) * (ymax - ymin)
+        return (self.sizes or self.measure())[0]
+
+    def margin(self):
+        return (self.sizes or self.measure())[1]
 
     def is_root(self):
         return self.parent is None
 
 
-from collections import deque
+class QueryCache:
+    # region -> result list, least recently used first, bounded by entry count and approximate bytes
+    # one lock around every method, so reader threads of a ConcurrentRTree can share it
+    def __init__(self, max_entries=1024, max_bytes=None, intersect=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # the tree's own intersect(region, mbr), so regions of any dimension are tested; 2-d without one
+        self.intersect = intersect or (lambda r, m: not (r[0] > m[2] or r[2] < m[0] or r[1] > m[3] or r[3] < m[1]))
+        self.lock = threading.Lock()
+        # bumped by every invalidate, a put computed before the last invalidate is dropped as possibly stale
+        self.generation = 0
+        self.results = OrderedDict()
+        self.sizes = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, region):
+        with self.lock:
+            results = self.results.get(region)
+            if results is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.results.move_to_end(region)
+            return results
+
+    def put(self, region, results, generation=None):
+        size = sys.getsizeof(results) + (len(results) * sys.getsizeof(results[0]) if results else 0)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.drop(region)
+            self.results[region] = results
+            self.sizes[region] = size
+            self.bytes += size
+            while len(self.results) > self.max_entries or (self.max_bytes is not None and self.bytes > self.max_bytes):
+                self.drop(next(iter(self.results)))
+                self.evictions += 1
+
+    def drop(self, region):
+        if region in self.results:
+            del self.results[region]
+            self.bytes -= self.sizes.pop(region)
+
+    def invalidate(self, mbr):
+        with self.lock:
+            self.generation += 1
+            for region in [r for r in self.results if self.intersect(r, mbr)]:
+                self.drop(region)
+                self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.results.clear()
+            self.sizes.clear()
+            self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'entries': len(self.results), 'bytes': self.bytes, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0, 'evictions': self.evictions,
+                'invalidations': self.invalidations}
+
+
+class TreeProfiler:
+    # totals and power-of-two histograms of the per-call counters, plus an optional callback(kind, counters)
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.active = None  # counters of the insert being profiled
+        self.calls = Counter()
+        self.totals = {'range_search': Counter(), 'insert': Counter()}
+        self.histograms = {'range_search': {}, 'insert': {}}
+        self.last = {}
+
+    def count(self, event):
+        # the split, reinsert and descent sites call this, it only counts while an insert is profiled
+        if self.active is not None:
+            self.active[event] += 1
+
+    def record(self, kind, counters):
+        self.calls[kind] += 1
+        self.totals[kind].update(counters)
+        self.last[kind] = counters
+        for name, value in counters.items():
+            if name != 'seconds':
+                bucket = 1 << (value.bit_length() - 1) if value > 0 else 0
+                self.histograms[kind].setdefault(name, Counter())[bucket] += 1
+        if self.callback is not None:
+            self.callback(kind, counters)
+
+    def report(self):
+        return {kind: {'calls': self.calls[kind],
+                       'mean': {name: total / self.calls[kind] for name, total in self.totals[kind].items()},
+                       'histograms': {name: dict(sorted(h.items())) for name, h in self.histograms[kind].items()}}
+                for kind in ('range_search', 'insert') if self.calls[kind]}
+
+
+class PageFile:
+    # fixed-size page layout written by RTree.save:
+    # page 0 holds the header, every other page one node (leaf points or child MBR + page records)
+    HEADER = struct.Struct('<4sIII12sB4d')  # magic, page size, root page, limit, split policy, root is_leaf, root mbr
+    NODE = struct.Struct('<BI')  # is_leaf, entry count
+    CHILD = struct.Struct('<4dIB')  # child mbr, child page, child is_leaf
+    POINT = struct.Struct('<2d')
+    MAGIC = b'RTP1'
+
+    def __init__(self, path, compact=False):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = self.HEADER.unpack_from(self.mm, 0)
+        if header[0] != self.MAGIC:
+            raise ValueError(f'{path} is not an RTree page file')
+        self.page_size, self.root_page, self.limit = header[1:4]
+        self.split = header[4].rstrip(b'\0').decode()
+        self.root_is_leaf = bool(header[5])
+        self.root_mbr = header[6:]
+        self.compact = compact
+
+    def read(self, node):
+        offset = node.page * self.page_size
+        _, count = self.NODE.unpack_from(self.mm, offset)
+        offset += self.NODE.size
+        if node.is_leaf:
+            if self.compact:
+                points = PointArray()
+                points.coords.frombytes(self.mm[offset:offset + count * self.POINT.size])
+                return points
+            return list(self.POINT.iter_unpack(self.mm[offset:offset + count * self.POINT.size]))
+        children = []
+        for record in self.CHILD.iter_unpack(self.mm[offset:offset + count * self.CHILD.size]):
+            children.append(DiskNode(self, record[4], record[:4], bool(record[5]), node))
+        return children
+
+    def close(self):
+        self.mm.close()
+
+
+class DiskNode(Node):
+    # node of a loaded tree: mbr and is_leaf come from the parent's page, entries are decoded on first access
+    __slots__ = ('store', 'page')
+
+    def __init__(self, store, page, mbr, is_leaf, parent=None):
+        self.store = store
+        self.page = page
+        self.mbr = mbr
+        self.is_leaf = is_leaf
+        self.parent = parent
+        self.arrays = None
+        self.payloads = None
+        self.sizes = None
+        self.keys = None
+
+    def __getattr__(self, name):
+        # only reached while the entries slot is still empty
+        if name != 'entries':
+            raise AttributeError(name)
+        self.entries = self.store.read(self)
+        return self.entries
+
+
+def hilbert_value(x, y, order=16):
+    # distance of cell (x, y) along a Hilbert curve covering a 2^order x 2^order grid
+    d = 0
+    s = 1 << (order - 1)
+    while s > 0:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        d += s * s * ((3 * rx) ^ ry)
+        if ry == 0:
+            if rx == 1:
+                x = s - 1 - x
+                y = s - 1 - y
+            x, y = y, x
+        s >>= 1
+    return d
+
 
 class RTree:
-    def __init__(self,m):
+    SPLIT_POLICIES = ('sort', 'linear', 'quadratic', 'rstar')
+    CHOOSE_POLICIES = ('area', 'rstar')
+    PREDICATES = ('intersects', 'contains', 'within')
+    OUTPUTS = ('points', 'ids', 'payloads', 'both')
+
+    dims = 2
+
+    def __init__(self,m, split='quadratic', vectorized=False, compact=False, payloads=False, min_fill=None,
+                 choose='area'):
+        # m is the most entries a node holds (M), min_fill the fewest a non-root node keeps, 40% of m by default;
+        # choose picks the subtree on insert: least area enlargement, or R* least overlap enlargement above the leaves
+        if split not in self.SPLIT_POLICIES:
+            raise ValueError(f'Unknown split policy: {split}')
+        if choose not in self.CHOOSE_POLICIES:
+            raise ValueError(f'Unknown choose policy: {choose}')
+        if min_fill is None:
+            min_fill = max(1, int(0.4 * m))
+        if not 1 <= min_fill <= m // 2:
+            raise ValueError(f'min_fill must be between 1 and m // 2, got {min_fill}')
+        if vectorized and np is None:
+            raise ImportError('vectorized mode needs numpy')
+        self.vectorized = vectorized
+        self.compact = compact
+        self.payloads = payloads  # keep a payload column next to the points of every leaf
         self.limit=m
+        self.min_fill = min_fill
+        self.split_policy = split
+        self.choose_policy = choose
+        self.reinserting = False
+        self.cache = None
+        self.profiler = None
         self.root = Node()
 
-    def insert(self, entry, node=None):
+    @classmethod
+    def from_points(cls, points, m, method='str', split='quadratic', vectorized=False, compact=False, payloads=None,
+                    **kwargs):
+        # bulk load: pack full leaves, then build the upper levels bottom-up;
+        # payloads, if given, are matched to points by position
+        if payloads is not None:
+            kwargs['payloads'] = True
+        tree = cls(m, split, vectorized, compact, **kwargs)
+        points = list(points)
+        if not points:
+            return tree
+        if method == 'str':
+            groups = tree.str_pack(points, tree.entry_x, tree.entry_y)
+        elif method == 'hilbert':
+            groups = tree.hilbert_pack(points, lambda p: (tree.entry_x(p), tree.entry_y(p)))
+        else:
+            raise ValueError(f'Unknown bulk load method: {method}')
+        groups = tree.fill_groups(groups)
+        if payloads is not None:
+            payloads = list(payloads)
+            for payload in payloads:
+                tree.check_payload(payload)
+        columns = tree.regroup(zip(points, payloads), groups) if payloads is not None else [()] * len(groups)
+        level = [tree.make_leaf(tree.compute_mbr(g), g, column) for g, column in zip(groups, columns)]
+        while len(level) > 1:
+            if method == 'str':
+                groups = tree.str_pack(level, lambda n: (n.mbr[0] + n.mbr[2]) / 2, lambda n: (n.mbr[1] + n.mbr[3]) / 2)
+            else:
+                # children are already in Hilbert order, consecutive runs stay close together
+                groups = [level[i:i + m] for i in range(0, len(level), m)]
+            groups = tree.fill_groups(groups)
+            parents = []
+            for g in groups:
+                parent = Node(tree.compute_mbr(g), g, False)
+                for child in g:
+                    child.parent = parent
+                parents.append(parent)
+            level = parents
+        tree.root = level[0]
+        return tree
+
+    def save(self, path, page_size=None):
+        # one node per page, pages numbered breadth-first; the page size defaults to the smallest
+        # multiple of 4096 that holds the largest node
+        self.check_page_file()
+        nodes = [self.root]
+        for node in nodes:
+            if not node.is_leaf:
+                nodes.extend(node.entries)
+        pages = {id(node): i + 1 for i, node in enumerate(nodes)}
+        needed = max(PageFile.NODE.size + len(node.entries) * (PageFile.POINT.size if node.is_leaf else PageFile.CHILD.size)
+                     for node in nodes)
+        if page_size is None:
+            page_size = max(1, math.ceil(needed / 4096)) * 4096
+        elif page_size < max(needed, PageFile.HEADER.size):
+            raise ValueError(f'page_size {page_size} is too small, the largest node needs {needed} bytes')
+        with open(path, 'wb') as f:
+            f.write(PageFile.HEADER.pack(PageFile.MAGIC, page_size, 1, self.limit, self.split_policy.encode(),
+                                         self.root.is_leaf, *self.root.mbr).ljust(page_size, b'\0'))
+            for node in nodes:
+                page = PageFile.NODE.pack(node.is_leaf, len(node.entries))
+                if node.is_leaf:
+                    page += b''.join(PageFile.POINT.pack(entry[0], entry[1]) for entry in node.entries)
+                else:
+                    page += b''.join(PageFile.CHILD.pack(*child.mbr, pages[id(child)], child.is_leaf)
+                                     for child in node.entries)
+                f.write(page.ljust(page_size, b'\0'))
+
+    def check_page_file(self):
+        # raises ValueError if the tree holds something a page file cannot store
+        if self.payloads:
+            raise ValueError('page files do not store payloads')
+
+    @classmethod
+    def load(cls, path, vectorized=False, compact=False):
+        # memory-maps the page file, nodes are decoded only when a query reaches them
+        store = PageFile(path, compact)
+        tree = cls(store.limit, store.split, vectorized, compact)
+        tree.root = DiskNode(store, store.root_page, store.root_mbr, store.root_is_leaf)
+        return tree
+
+    def str_pack(self, items, key_x, key_y):
+        # Sort-Tile-Recursive: sqrt(P) vertical slabs, each sorted by y and cut into full runs
+        m = self.limit
+        pages = math.ceil(len(items) / m)
+        slab = math.ceil(math.sqrt(pages)) * m
+        items = sorted(items, key=key_x)
+        groups = []
+        for i in range(0, len(items), slab):
+            run = sorted(items[i:i + slab], key=key_y)
+            groups.extend(run[j:j + m] for j in range(0, len(run), m))
+        return groups
+
+    def fill_groups(self, groups):
+        # packing leaves short runs at the end of slabs: top them up from the run before,
+        # or merge the two when that one has nothing to spare, so every node keeps min_fill
+        filled = []
+        for group in groups:
+            short = self.min_fill - len(group)
+            if short > 0 and filled:
+                if len(filled[-1]) - short >= self.min_fill:
+                    group = filled[-1][-short:] + group
+                    filled[-1] = filled[-1][:-short]
+                else:
+                    group = filled.pop() + group
+            filled.append(group)
+        return filled
+
+    def hilbert_pack(self, items, key, order=16):
+        m = self.limit
+        coords = [key(item) for item in items]
+        xmin = min(c[0] for c in coords)
+        ymin = min(c[1] for c in coords)
+        span = max(max(c[0] for c in coords) - xmin, max(c[1] for c in coords) - ymin) or 1
+        side = (1 << order) - 1
+        ranked = sorted(zip(coords, items), key=lambda ci: hilbert_value(int((ci[0][0] - xmin) / span * side),
+                                                                        int((ci[0][1] - ymin) / span * side), order))
+        items = [item for _, item in ranked]
+        return [items[i:i + m] for i in range(0, len(items), m)]
+
+    def insert(self, entry, payload=None, node=None):
         if node is None:
+            if self.profiler is not None and self.profiler.active is None:
+                return self.profiled_insert(entry, payload)
+            self.check_payload(payload)
             node = self.root
+            self.invalidate_cache(self.mbr_of(entry))
 
         # origin from split then use existing mbrt
-        if isinstance(entry, Node):
-            entry_mbr = entry.mbr
+        entry_mbr = self.mbr_of(entry)
+
+        # descend to a leaf, the MBRs on the way are widened afterwards from the leaf up
+        while not node.is_leaf:
+            if not node.entries:
+                # empty root
+                node.entries.append(self.make_leaf(entry_mbr, [entry], [payload], node))
+                node.arrays = None
+                self.widen_path(node, entry_mbr)
+                return
+            if self.profiler is not None:
+                self.profiler.count('path_length')
+            node = self.writable_child(node, self.choose_subtree(node, entry_mbr))
+
+        #if node full not full
+        if len(node.entries) < self.limit:
+            node.entries.append(entry)
+            if self.payloads:
+                node.payloads.append(payload)
+            node.arrays = None
+            self.widen_path(node, entry_mbr)
+        # R* forced reinsertion, once per insert before falling back to a split
+        elif self.split_policy == 'rstar' and not self.reinserting and not node.is_root():
+            self.reinsert(node, entry, payload)
+        # split
         else:
-            entry_mbr = (entry[0], entry[1], entry[0], entry[1])
+            self.adjust_tree(node, *self.split(node, entry, payload))
 
-        # If leafnode
-        if node.is_leaf:
-            #if node full not full
-            if len(node.entries) < self.limit:
-                node.entries.append(entry)
-                node.update_mbr(entry_mbr)
-            # split
-            else:
-                node1, node2 = self.split(node, entry)
-                if node.is_root():
-                    self.root = Node(node.mbr, [node1, node2], False)
-                    node1.parent = self.root
-                    node2.parent = self.root
-                else:
-                    parent = node.parent
-                    parent.entries.remove(node)
-                    parent.entries.append(node1)
-                    parent.entries.append(node2)
-                    node1.parent = parent
-                    node2.parent = parent
-                    parent.update_mbr(node1.mbr)
-                    parent.update_mbr(node2.mbr)
+    def widen_path(self, node, mbr):
+        # carry a new entry's MBR up the parent links; a node that already covers it
+        # means its ancestors do too, so the walk stops there
+        while node is not None and node.update_mbr(mbr):
+            node = node.parent
+
+    def adjust_tree(self, node, node1, node2):
+        # Guttman's AdjustTree: node1 and node2 replace the split node in its parent; a parent that
+        # overflows is split the same way, up to the root, which grows the tree by one level
+        while not node.is_root():
+            parent = node.parent
+            parent.entries.remove(node)
+            parent.entries.append(node1)
+            node1.parent = node2.parent = parent
+            if len(parent.entries) < self.limit:
+                parent.entries.append(node2)
+                parent.arrays = None
+                self.widen_path(parent, self.union(node1.mbr, node2.mbr))
+                return
+            node, (node1, node2) = parent, self.split(parent, node2)
+        self.root = Node(self.union(node1.mbr, node2.mbr), [node1, node2], False)
+        node1.parent = node2.parent = self.root
+
+    def choose_subtree(self, node, entry_mbr):
+        if self.choose_policy == 'rstar' and node.entries[0].is_leaf:
+            return self.rstar_choose_subtree(node, entry_mbr)
+        # Select the child node that requires the least area enlargement
+        ex1, ey1, ex2, ey2 = entry_mbr
+        min_enlargement = float('inf')
+        min_area = float('inf')
+        min_index = -1
+        for i, child in enumerate(node.entries):
+            xmin, ymin, xmax, ymax = child.mbr
+            area = child.area()
+            enlargement = (max(xmax, ex2) - min(xmin, ex1)) * (max(ymax, ey2) - min(ymin, ey1)) - area
+            if enlargement < min_enlargement or (enlargement == min_enlargement and area < min_area):
+                min_enlargement = enlargement
+                min_area = area
+                min_index = i
+        return min_index
+
+    def rstar_choose_subtree(self, node, entry_mbr, candidates=32):
+        # R* above the leaves: the child whose growth adds the least overlap with its siblings, then the
+        # least area enlargement, then the smallest area; only the `candidates` children with the least
+        # area enlargement are tried, as the overlap test is quadratic in the node size
+        children = node.entries
+        if self.vectorized:
+            d = self.dims
+            a = node.packed()
+            e = np.array(entry_mbr, dtype=float)
+            grown = np.concatenate((np.minimum(a[:, :d], e[:d]), np.maximum(a[:, d:], e[d:])), axis=1)
+            area = np.prod(a[:, d:] - a[:, :d], axis=1)
+            enlargement = np.prod(grown[:, d:] - grown[:, :d], axis=1) - area
+            order = np.lexsort((area, enlargement))[:candidates]
+            if enlargement[order[0]] == 0:
+                return int(order[0])
+
+            def overlaps(boxes):
+                # total overlap of each box with every child
+                sides = np.minimum(boxes[:, None, d:], a[None, :, d:]) - np.maximum(boxes[:, None, :d], a[None, :, :d])
+                return np.prod(np.clip(sides, 0, None), axis=2).sum(axis=1)
+
+            # each box overlaps itself by its own area before and after growing, so that term cancels
+            growth = overlaps(grown[order]) - overlaps(a[order])
+            return int(order[np.lexsort((area[order], enlargement[order], growth))[0]])
+        grown = [self.union(child.mbr, entry_mbr) for child in children]
+        enlargement = [self.mbr_area(g) - child.area() for g, child in zip(grown, children)]
+        order = sorted(range(len(children)), key=lambda i: (enlargement[i], children[i].area()))[:candidates]
+        if enlargement[order[0]] == 0:
+            # fits without growing, so no overlap can be added either
+            return order[0]
+        best = None
+        for i in order:
+            key = (self.overlap_growth(children, i, grown[i]), enlargement[i], children[i].area())
+            if best is None or key < best[0]:
+                best = (key, i)
+        return best[1]
+
+    def overlap_growth(self, children, i, grown):
+        # how much the overlap of child i with its siblings grows when its MBR becomes grown
+        gx1, gy1, gx2, gy2 = grown
+        cx1, cy1, cx2, cy2 = children[i].mbr
+        growth = 0
+        for j, sibling in enumerate(children):
+            sx1, sy1, sx2, sy2 = sibling.mbr
+            w = min(gx2, sx2) - max(gx1, sx1)
+            h = min(gy2, sy2) - max(gy1, sy1)
+            # child i lies inside grown, so a sibling clear of grown overlaps neither
+            if j == i or w <= 0 or h <= 0:
+                continue
+            growth += w * h
+            w = min(cx2, sx2) - max(cx1, sx1)
+            h = min(cy2, sy2) - max(cy1, sy1)
+            if w > 0 and h > 0:
+                growth -= w * h
+        return growth
+
+    def writable_child(self, node, i):
+        # child the insert path is about to change; ConcurrentRTree hands out a private copy here
+        return node.entries[i]
+
+    def find_leaf(self, point):
+        # leaf holding the point and its index there, (None, -1) if the point is not stored
+        target = self.mbr_of(point)
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.is_leaf:
+                for i, entry in enumerate(node.entries):
+                    if self.entry_matches(entry, point):
+                        return node, i
+            else:
+                stack.extend(child for child in node.entries if self.contains(child.mbr, target))
+        return None, -1
 
+    def entry_matches(self, entry, point):
+        # (x, y) matches any entry at those coordinates, longer tuples must match exactly
+        return entry[0] == point[0] and entry[1] == point[1] and (len(point) == 2 or tuple(entry) == tuple(point))
+
+    def contains(self, outer, inner):
+        return outer[0] <= inner[0] and outer[1] <= inner[1] and inner[2] <= outer[2] and inner[3] <= outer[3]
+
+    def delete(self, point):
+        leaf, index = self.find_leaf(point)
+        if leaf is None:
+            return False
+        self.invalidate_cache(self.mbr_of(point))
+        self.remove_entry(leaf, index)
+        self.condense_tree(leaf)
+        # a root with a single child is not needed
+        while not self.root.is_leaf and len(self.root.entries) == 1:
+            self.root = self.root.entries[0]
+            self.root.parent = None
+        return True
+
+    def update(self, old, new):
+        leaf, index = self.find_leaf(old)
+        if leaf is None:
+            return False
+        self.invalidate_cache(self.mbr_of(old))
+        self.invalidate_cache(self.mbr_of(new))
+        if self.contains(leaf.mbr, self.mbr_of(new)):
+            # still inside the same leaf, overwrite in place; the leaf MBR stays valid
+            leaf.entries[index] = new
+            leaf.touch()
         else:
-            # Select the child node that requires the least area enlargement
-            min_enlargement = float('inf')
-            min_area = float('inf')
-            min_index = -1
-            if node.entries:
-                for i, child in enumerate(node.entries):
-                    enlargement = self.area_enlargement(child.mbr, entry_mbr)
-                    if enlargement < min_enlargement or (enlargement == min_enlargement and child.area() < min_area):
-                        min_enlargement = enlargement
-                        min_area = child.area()
-                        min_index = i
-                self.insert(entry, node.entries[min_index])
-            else:
-                node.entries.append(Node(entry_mbr, [entry], True, node))
-                node.update_mbr(entry_mbr)
+            payload = self.remove_entry(leaf, index)
+            self.condense_tree(leaf)
+            self.insert(new, payload)
+        return True
+
+    def remove_entry(self, leaf, index):
+        # drops one leaf entry and returns its payload
+        del leaf.entries[index]
+        if leaf.payloads is None:
+            return None
+        payload = leaf.payloads[index]
+        del leaf.payloads[index]
+        return payload
+
+    def condense_tree(self, node):
+        # Guttman's CondenseTree: drop underfull nodes on the way up, shrink the rest, reinsert the orphans
+        orphans = []
+        while not node.is_root():
+            parent = node.parent
+            if len(node.entries) < self.min_fill:
+                parent.entries.remove(node)
+                parent.touch()
+                orphans.append(node)
+            else:
+                node.mbr = self.compute_mbr(node.entries)
+                node.touch()
+            node = parent
+        node.mbr = self.compute_mbr(node.entries) if node.entries else self.empty_mbr()
+        node.touch()
+        for orphan in orphans:
+            for point, payload in self.iter_records(orphan):
+                self.insert(point, payload)
 
+    def iter_points(self, node=None):
+        stack = [node or self.root]
+        while stack:
+            node = stack.pop()
+            if node.is_leaf:
+                yield from node.entries
+            else:
+                stack.extend(node.entries)
+
+    def iter_records(self, node=None):
+        # (point, payload) pairs, payload is None in a tree without a payload column
+        stack = [node or self.root]
+        while stack:
+            node = stack.pop()
+            if node.is_leaf:
+                yield from zip(node.entries, itertools.repeat(None) if node.payloads is None else node.payloads)
+            else:
+                stack.extend(node.entries)
 
     def area_enlargement(self, mbr, entry):
         xmin, ymin, xmax, ymax = mbr
-        new_area = (max(xmax, entry[0]) - min(xmin, entry[0])) * (max(ymax, entry[1]) - min(ymin, entry[1]))
+        new_area = (max(xmax, entry[2]) - min(xmin, entry[0])) * (max(ymax, entry[3]) - min(ymin, entry[1]))
         old_area = (xmax - xmin) * (ymax - ymin)  # Use direct calculation instead of calling self.area(mbr)
         return new_area - old_area
 
-    def split(self, node, entry):
-        # Linear split
+    def split(self, node, entry, payload=None):
+        if self.profiler is not None:
+            self.profiler.count('splits')
         entries = node.entries + [entry]
-        entries.sort(key=lambda x: x.mbr[0] if isinstance(x, Node) else x[0])
-        l1 = entries[:len(entries) // 2]
-        l2 = entries[len(entries) // 2:]
-        n1 = Node(mbr=self.compute_mbr(l1), entries=l1, is_leaf=True)
-        n2 = Node(mbr=self.compute_mbr(l2), entries=l2, is_leaf=True)
+        # pair payloads up before the policies reorder entries in place
+        records = list(zip(entries, list(node.payloads) + [payload])) if node.payloads is not None else None
+        if self.split_policy == 'linear':
+            l1, l2 = self.linear_split(entries)
+        elif self.split_policy == 'quadratic':
+            l1, l2 = self.quadratic_split(entries)
+        elif self.split_policy == 'rstar':
+            l1, l2 = self.rstar_split(entries)
+        else:
+            l1, l2 = self.sort_split(entries)
+        if node.is_leaf:
+            p1, p2 = self.regroup(records, (l1, l2)) if records is not None else ((), ())
+            return self.make_leaf(self.compute_mbr(l1), l1, p1), self.make_leaf(self.compute_mbr(l2), l2, p2)
+        n1 = Node(mbr=self.compute_mbr(l1), entries=l1, is_leaf=node.is_leaf)
+        n2 = Node(mbr=self.compute_mbr(l2), entries=l2, is_leaf=node.is_leaf)
+        for n in (n1, n2):
+            for e in n.entries:
+                if isinstance(e, Node):
+                    e.parent = n
         return n1, n2
 
+    def leaf_entries(self, points):
+        return PointArray(points) if self.compact else points
+
+    def check_payload(self, payload):
+        if self.compact and self.payloads and not hasattr(payload, '__index__'):
+            raise ValueError(f'compact payload trees store integer ids, got {payload!r}')
+
+    def leaf_payloads(self, payloads):
+        # compact trees keep integer ids in an array('q'), others any objects in a list
+        return array('q', payloads) if self.compact else list(payloads)
+
+    def make_leaf(self, mbr, points, payloads=(), parent=None):
+        return Node(mbr, self.leaf_entries(points), True, parent, self.leaf_payloads(payloads) if self.payloads else None)
+
+    def regroup(self, records, groups):
+        # payload column of each group, the groups hold the entry objects of the (entry, payload) records
+        slots = {}
+        for entry, payload in records:
+            slots.setdefault(id(entry), []).append(payload)
+        return [[slots[id(entry)].pop() for entry in group] for group in groups]
+
+    def check_invariants(self):
+        # raises ValueError on the first broken invariant: all leaves on one level, min_fill..m entries
+        # per node (the root, or its only child, only up to m), parent links, MBRs covering
+        # their entries and payload columns as long as the entries; returns the height and counts
+        report = {'height': 0, 'nodes': 0, 'points': 0}
+        leaf_depth = None
+        stack = [(self.root, 1)]
+        while stack:
+            node, depth = stack.pop()
+            report['nodes'] += 1
+            n = len(node.entries)
+            if n > self.limit:
+                raise ValueError(f'node at depth {depth} holds {n} entries, more than m={self.limit}')
+            top = node is self.root or (node.parent is self.root and len(self.root.entries) == 1)
+            if not top and n < self.min_fill:
+                raise ValueError(f'node at depth {depth} holds {n} entries, fewer than min_fill={self.min_fill}')
+            if node.is_leaf:
+                if leaf_depth is None:
+                    leaf_depth = depth
+                elif depth != leaf_depth:
+                    raise ValueError(f'leaves at depths {leaf_depth} and {depth}')
+                if (node.payloads is not None or self.payloads) and len(node.payloads or ()) != n:
+                    raise ValueError(f'leaf at depth {depth} has {n} entries but {len(node.payloads or ())} payloads')
+                report['points'] += n
+            else:
+                for child in node.entries:
+                    if child.parent is not node:
+                        raise ValueError(f'child at depth {depth + 1} does not point back to its parent')
+                    stack.append((child, depth + 1))
+            for entry in node.entries:
+                if not self.contains(node.mbr, self.mbr_of(entry)):
+                    raise ValueError(f'node MBR {node.mbr} at depth {depth} does not cover {self.mbr_of(entry)}')
+        report['height'] = leaf_depth or 0
+        return report
+
+    def memory_usage(self):
+        # approximate deep size of the index: nodes, their MBR tuples and the stored points
+        report = {'nodes': 0, 'points': 0, 'node_bytes': 0, 'point_bytes': 0}
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            report['nodes'] += 1
+            report['node_bytes'] += sys.getsizeof(node) + sys.getsizeof(node.mbr) + sum(map(sys.getsizeof, node.mbr))
+            if node.arrays is not None:
+                report['node_bytes'] += node.arrays.nbytes
+            if not node.is_leaf:
+                report['node_bytes'] += sys.getsizeof(node.entries)
+                stack.extend(node.entries)
+            elif isinstance(node.entries, PointArray):
+                report['points'] += len(node.entries)
+                report['point_bytes'] += sys.getsizeof(node.entries) + sys.getsizeof(node.entries.coords)
+            else:
+                report['points'] += len(node.entries)
+                report['point_bytes'] += sys.getsizeof(node.entries)
+                for entry in node.entries:
+                    report['point_bytes'] += sys.getsizeof(entry) + sum(map(sys.getsizeof, entry))
+        report['total_bytes'] = report['node_bytes'] + report['point_bytes']
+        report['bytes_per_point'] = report['total_bytes'] / report['points'] if report['points'] else 0
+        return report
+
+    def mbr_of(self, entry):
+        return entry.mbr if isinstance(entry, Node) else (entry[0], entry[1], entry[0], entry[1])
+
+    def empty_mbr(self):
+        return (float('inf'),) * self.dims + (float('-inf'),) * self.dims
+
+    def entry_x(self, entry):
+        return entry[0]
+
+    def entry_y(self, entry):
+        return entry[1]
+
+    def in_region(self, entry, region):
+        return region[0] <= entry[0] <= region[2] and region[1] <= entry[1] <= region[3]
+
+    def sort_split(self, entries):
+        # sort by xmin and cut in half
+        entries.sort(key=lambda x: self.mbr_of(x)[0])
+        return entries[:len(entries) // 2], entries[len(entries) // 2:]
+
+    def linear_split(self, entries):
+        # Ang-Tan: send each entry towards the nearer side of the node MBR, pick the more even axis
+        d = self.dims
+        bounds = self.compute_mbr(entries)
+        sides = [([], []) for _ in range(d)]
+        for e in entries:
+            m = self.mbr_of(e)
+            for axis in range(d):
+                sides[axis][0 if m[axis] - bounds[axis] < bounds[axis + d] - m[axis + d] else 1].append(e)
+        candidates = []
+        for l1, l2 in sides:
+            if len(l1) >= self.min_fill and len(l2) >= self.min_fill:
+                m1, m2 = self.compute_mbr(l1), self.compute_mbr(l2)
+                candidates.append((max(len(l1), len(l2)), self.overlap(m1, m2),
+                                   self.mbr_area(m1) + self.mbr_area(m2), l1, l2))
+        if not candidates:
+            return self.sort_split(entries)
+        best = min(candidates, key=lambda c: c[:3])
+        return best[3], best[4]
+
+    def quadratic_split(self, entries):
+        # Guttman: seed with the most wasteful pair, then assign the entry with the strongest preference
+        mbrs = [self.mbr_of(e) for e in entries]
+        worst = float('-inf')
+        seeds = (0, 1)
+        for i in range(len(entries)):
+            for j in range(i + 1, len(entries)):
+                d = self.mbr_area(self.union(mbrs[i], mbrs[j])) - self.mbr_area(mbrs[i]) - self.mbr_area(mbrs[j])
+                if d > worst:
+                    worst = d
+                    seeds = (i, j)
+        g1, g2 = [entries[seeds[0]]], [entries[seeds[1]]]
+        m1, m2 = mbrs[seeds[0]], mbrs[seeds[1]]
+        rest = [i for i in range(len(entries)) if i not in seeds]
+        while rest:
+            if len(g1) + len(rest) <= self.min_fill:
+                g1.extend(entries[i] for i in rest)
+                break
+            if len(g2) + len(rest) <= self.min_fill:
+                g2.extend(entries[i] for i in rest)
+                break
+            best = max(rest, key=lambda i: abs(self.area_enlargement(m1, mbrs[i]) - self.area_enlargement(m2, mbrs[i])))
+            rest.remove(best)
+            d1 = self.area_enlargement(m1, mbrs[best])
+            d2 = self.area_enlargement(m2, mbrs[best])
+            if (d1, self.mbr_area(m1), len(g1)) <= (d2, self.mbr_area(m2), len(g2)):
+                g1.append(entries[best])
+                m1 = self.union(m1, mbrs[best])
+            else:
+                g2.append(entries[best])
+                m2 = self.union(m2, mbrs[best])
+        return g1, g2
+
+    def rstar_split(self, entries):
+        # R*: axis with the smallest margin sum, then the distribution with the least overlap
+        k = len(entries)
+        best_axis = None
+        for axis in range(self.dims):
+            margin = 0
+            sortings = []
+            for bound in (axis, axis + self.dims):
+                ordered = sorted(entries, key=lambda e: self.mbr_of(e)[bound])
+                sortings.append(ordered)
+                for i in range(self.min_fill, k - self.min_fill + 1):
+                    margin += self.margin(self.compute_mbr(ordered[:i])) + self.margin(self.compute_mbr(ordered[i:]))
+            if best_axis is None or margin < best_axis[0]:
+                best_axis = (margin, sortings)
+        best = None
+        for ordered in best_axis[1]:
+            for i in range(self.min_fill, k - self.min_fill + 1):
+                m1, m2 = self.compute_mbr(ordered[:i]), self.compute_mbr(ordered[i:])
+                key = (self.overlap(m1, m2), self.mbr_area(m1) + self.mbr_area(m2))
+                if best is None or key < best[0]:
+                    best = (key, ordered[:i], ordered[i:])
+        return best[1], best[2]
+
+    def reinsert(self, node, entry, payload=None):
+        # remove the 30% of entries farthest from the node centre and insert them again from the root
+        if self.profiler is not None:
+            self.profiler.count('reinserts')
+        entries = node.entries + [entry]
+        payloads = list(node.payloads) + [payload] if node.payloads is not None else [None] * len(entries)
+        d = self.dims
+        bounds = self.compute_mbr(entries)
+        centre = [bounds[axis] + bounds[axis + d] for axis in range(d)]
+
+        def distance(e):
+            m = self.mbr_of(e)
+            return sum((m[axis] + m[axis + d] - centre[axis]) ** 2 for axis in range(d))
+
+        order = sorted(range(len(entries)), key=lambda i: distance(entries[i]))
+        entries = [entries[i] for i in order]
+        payloads = [payloads[i] for i in order]
+        p = max(1, int(len(entries) * 0.3))
+        node.entries = self.leaf_entries(entries[:-p]) if node.is_leaf else entries[:-p]
+        if node.payloads is not None:
+            node.payloads = self.leaf_payloads(payloads[:-p])
+        node.mbr = self.compute_mbr(node.entries)
+        node.touch()
+        parent = node.parent
+        while parent is not None:
+            parent.mbr = self.compute_mbr(parent.entries)
+            parent.touch()
+            parent = parent.parent
+        self.reinserting = True
+        try:
+            for e, payload in zip(entries[-p:], payloads[-p:]):
+                self.insert(e, payload)
+        finally:
+            self.reinserting = False
+
+    def union(self, mbr1, mbr2):
+        return (min(mbr1[0], mbr2[0]), min(mbr1[1], mbr2[1]), max(mbr1[2], mbr2[2]), max(mbr1[3], mbr2[3]))
+
+    def mbr_area(self, mbr):
+        return (mbr[2] - mbr[0]) * (mbr[3] - mbr[1])
+
+    def margin(self, mbr):
+        return (mbr[2] - mbr[0]) + (mbr[3] - mbr[1])
+
+    def overlap(self, mbr1, mbr2):
+        dx = min(mbr1[2], mbr2[2]) - max(mbr1[0], mbr2[0])
+        dy = min(mbr1[3], mbr2[3]) - max(mbr1[1], mbr2[1])
+        return dx * dy if dx > 0 and dy > 0 else 0
+
+    def overlap_stats(self):
+        # sibling overlap per level, and how many of the nodes overlap a sibling
+        stats = {'nodes': 0, 'sibling_pairs': 0, 'overlapping_pairs': 0, 'overlap_area': 0, 'levels': []}
+        level = [self.root]
+        while level:
+            pairs = overlapping = area = 0
+            children = []
+            for node in level:
+                stats['nodes'] += 1
+                kids = [e for e in node.entries if isinstance(e, Node)]
+                counts = self.sibling_overlap([child.mbr for child in kids])
+                pairs += counts[0]
+                overlapping += counts[1]
+                area += counts[2]
+                children.extend(kids)
+            if children:
+                stats['levels'].append({'pairs': pairs, 'overlapping_pairs': overlapping, 'overlap_area': area})
+                stats['sibling_pairs'] += pairs
+                stats['overlapping_pairs'] += overlapping
+                stats['overlap_area'] += area
+            level = children
+        return stats
+
+    def sibling_overlap(self, mbrs):
+        # (pairs, overlapping pairs, total overlap area) among the MBRs of one node's children
+        pairs = overlapping = area = 0
+        for i in range(len(mbrs)):
+            for j in range(i + 1, len(mbrs)):
+                o = self.overlap(mbrs[i], mbrs[j])
+                pairs += 1
+                if o > 0:
+                    overlapping += 1
+                    area += o
+        return pairs, overlapping, area
+
+    def stats(self, sample=None, seed=0):
+        # tree quality report; sample=k follows k random root-to-leaf paths instead of walking every node,
+        # level sizes are then estimated from the product of the fanouts along each path
+        if sample is None:
+            levels = []
+            level = [self.root]
+            while level:
+                levels.append(level)
+                level = [child for node in level if not node.is_leaf for child in node.entries]
+            sizes = [len(level) for level in levels]
+        else:
+            rnd = random.Random(seed)
+            seen = []
+            estimates = []
+            for _ in range(sample):
+                node = self.root
+                weight = 1
+                depth = 0
+                while True:
+                    if depth == len(seen):
+                        seen.append({})
+                        estimates.append([])
+                    seen[depth][id(node)] = node
+                    estimates[depth].append(weight)
+                    if node.is_leaf or not node.entries:
+                        break
+                    weight *= len(node.entries)
+                    node = rnd.choice(node.entries)
+                    depth += 1
+            levels = [list(level.values()) for level in seen]
+            # paths that stop early count as zero for the deeper levels
+            sizes = [round(sum(e) / sample) for e in estimates]
+        report = {'sampled': sample is not None, 'height': len(levels), 'nodes': sum(sizes), 'levels': [],
+                  'fill_histogram': Counter(), 'overlap_area': 0, 'overlapping_pairs': 0, 'dead_space': 0}
+        fills = []
+        for depth, (level, size) in enumerate(zip(levels, sizes)):
+            scale = size / len(level)
+            level_fills = [len(node.entries) / self.limit for node in level]
+            fills.extend(level_fills)
+            pairs = overlapping = overlap = dead = area = 0
+            for node in level:
+                area += self.mbr_area(node.mbr) if node.entries else 0
+                if node.is_leaf:
+                    continue
+                kids = [child.mbr for child in node.entries]
+                dead += self.mbr_area(node.mbr) - self.union_area(kids) if kids else 0
+                counts = self.sibling_overlap(kids)
+                pairs += counts[0]
+                overlapping += counts[1]
+                overlap += counts[2]
+            histogram = Counter(min(int(f * 10), 10) * 10 for f in level_fills)
+            report['fill_histogram'].update({k: round(v * scale) for k, v in histogram.items()})
+            report['levels'].append({
+                'level': depth, 'nodes': size, 'leaves': round(sum(node.is_leaf for node in level) * scale),
+                'mean_fill': sum(level_fills) / len(level_fills), 'min_fill': min(level_fills), 'max_fill': max(level_fills),
+                'fill_histogram': dict(sorted(histogram.items())), 'area': area * scale,
+                'sibling_pairs': round(pairs * scale), 'overlapping_pairs': round(overlapping * scale),
+                'overlap_area': overlap * scale, 'dead_space': dead * scale})
+            report['overlap_area'] += overlap * scale
+            report['overlapping_pairs'] += round(overlapping * scale)
+            report['dead_space'] += dead * scale
+        report['fill_histogram'] = dict(sorted(report['fill_histogram'].items()))
+        report['mean_fill'] = sum(fills) / len(fills)
+        root_area = self.mbr_area(self.root.mbr) if self.root.entries else 0
+        # total node area per level over the root area, 1.0 means the level tiles the root without overlap
+        report['coverage'] = [lv['area'] / root_area if root_area else 0 for lv in report['levels']]
+        return report
+
+    def union_area(self, mbrs):
+        # area covered by a set of rectangles: x slabs between consecutive edges, merged y intervals inside each
+        xs = sorted({x for m in mbrs for x in (m[0], m[2])})
+        total = 0
+        for x1, x2 in zip(xs, xs[1:]):
+            spans = sorted((m[1], m[3]) for m in mbrs if m[0] <= x1 and m[2] >= x2)
+            covered = 0
+            top = float('-inf')
+            for y1, y2 in spans:
+                if y2 > top:
+                    covered += y2 - max(y1, top)
+                    top = y2
+            total += covered * (x2 - x1)
+        return total
+
+    def nodes_visited(self, region):
+        # number of nodes range_search would enter for this region
+        count = 0
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            count += 1
+            if not node.is_leaf:
+                stack.extend(child for child in node.entries if self.intersect(child.mbr, region))
+        return count
+
     def compute_mbr(self, entries):
-        entries = [entry.mbr if isinstance(entry, Node) else entry for entry in entries]
-        xmin = min(entries, key=lambda x: x[0])[0]
-        ymin = min(entries, key=lambda x: x[1])[1]
-        xmax = max(entries, key=lambda x: x[0])[0]
-        ymax = max(entries, key=lambda x: x[1])[1]
+        # one pass over the entries, widening all four bounds as it goes
+        mbr_of = self.mbr_of
+        xmin = ymin = float('inf')
+        xmax = ymax = float('-inf')
+        for entry in entries:
+            x1, y1, x2, y2 = mbr_of(entry)
+            if x1 < xmin:
+                xmin = x1
+            if y1 < ymin:
+                ymin = y1
+            if x2 > xmax:
+                xmax = x2
+            if y2 > ymax:
+                ymax = y2
         return (xmin, ymin, xmax, ymax)
 
-    def range_search(self, region, node=None):
-        if node is None:
-            node = self.root
+    def range_search(self, region, node=None, output='points'):
+        # output: 'points', 'payloads', (point, payload) pairs for 'both', or 'ids', integer payloads
+        # as one array (numpy in vectorized mode, array('q') otherwise)
+        if output != 'points':
+            return self.collect_payloads(region, node, output)
+        if self.cache is None or node is not None:
+            return self.collect_range(region, node)
+        region = tuple(region)
+        # read before the tree is walked, so a change that lands during the walk keeps the result out of the cache
+        generation = self.cache.generation
+        results = self.cache.get(region)
+        if results is None:
+            results = self.collect_range(region)
+            self.cache.put(region, results, generation)
+        return list(results)
+
+    def collect_range(self, region, node=None):
+        if self.profiler is None:
+            return list(self.iter_range(region, node))
+        return self.profiled_range(region, node)
 
+    def collect_payloads(self, region, node=None, output='payloads'):
+        if output not in self.OUTPUTS:
+            raise ValueError(f'Unknown output: {output}')
+        if not self.payloads:
+            raise ValueError('this tree has no payload column, create it with payloads=True')
+        hits = self.iter_leaf_hits(region, node)
+        if output == 'ids':
+            if self.vectorized:
+                # array('q') columns are viewed in place, only the matching ids are copied out
+                parts = [(np.frombuffer(leaf.payloads, dtype=np.int64) if isinstance(leaf.payloads, array)
+                          else np.asarray(leaf.payloads, dtype=np.int64))[index] for leaf, index in hits]
+                return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+            ids = array('q')
+            for leaf, index in hits:
+                ids.extend(leaf.payloads[i] for i in index)
+            return ids
         results = []
+        for leaf, index in hits:
+            if self.vectorized:
+                index = index.tolist()
+            if output == 'payloads':
+                results.extend(leaf.payloads[i] for i in index)
+            else:
+                results.extend((leaf.entries[i], leaf.payloads[i]) for i in index)
+        return results
 
-        if node.is_leaf:
+    def iter_leaf_hits(self, region, node=None):
+        # (leaf, positions of its matching entries) for every leaf with at least one match
+        stack = [node or self.root]
+        if self.vectorized:
+            d = self.dims
+            lo = np.array(region[:d], dtype=float)
+            hi = np.array(region[d:], dtype=float)
+            while stack:
+                node = stack.pop()
+                a = node.packed()
+                if node.is_leaf:
+                    index = np.flatnonzero(np.all((a >= lo) & (a <= hi), axis=1))
+                    if index.size:
+                        yield node, index
+                else:
+                    hits = np.all(a[:, :d] <= hi, axis=1) & np.all(a[:, d:] >= lo, axis=1)
+                    stack.extend(map(node.entries.__getitem__, np.flatnonzero(hits)[::-1].tolist()))
+            return
+        while stack:
+            node = stack.pop()
+            if node.is_leaf:
+                index = [i for i, entry in enumerate(node.entries) if self.in_region(entry, region)]
+                if index:
+                    yield node, index
+            else:
+                for child in reversed(node.entries):
+                    if self.intersect(child.mbr, region):
+                        stack.append(child)
+
+    def enable_profiler(self, callback=None):
+        # per-call counters for range_search and insert; with no profiler the only cost is one None check per call
+        self.profiler = TreeProfiler(callback)
+        return self.profiler
+
+    def profiled_range(self, region, node=None):
+        counters = {'nodes_visited': 0, 'leaves_visited': 0, 'intersect_calls': 0, 'points_scanned': 0}
+        start = time.perf_counter()
+        results = []
+        for node, hits in self.walk_range(region, node):
+            counters['nodes_visited'] += 1
+            if node.is_leaf:
+                counters['leaves_visited'] += 1
+                counters['points_scanned'] += len(node.entries)
+                results.extend(hits)
+            else:
+                counters['intersect_calls'] += len(node.entries)
+        counters['leaf_hits'] = len(results)
+        counters['leaf_misses'] = counters['points_scanned'] - len(results)
+        counters['seconds'] = time.perf_counter() - start
+        self.profiler.record('range_search', counters)
+        return results
+
+    def profiled_insert(self, entry, payload=None):
+        # the descent, split and reinsert sites add to these counters through profiler.count while the insert runs
+        counters = {'path_length': 0, 'splits': 0, 'reinserts': 0}
+        self.profiler.active = counters
+        start = time.perf_counter()
+        try:
+            return self.insert(entry, payload)
+        finally:
+            self.profiler.active = None
+            counters['seconds'] = time.perf_counter() - start
+            self.profiler.record('insert', counters)
+
+    def enable_cache(self, max_entries=1024, max_bytes=None):
+        # LRU cache of range_search results, only regions touching a changed point are evicted
+        self.cache = QueryCache(max_entries, max_bytes, self.intersect)
+        return self.cache
+
+    def invalidate_cache(self, mbr):
+        if self.cache is not None:
+            self.cache.invalidate(mbr)
+
+    def iter_range(self, region, node=None):
+        # explicit stack instead of recursion, matches are yielded as they are found
+        xmin, ymin, xmax, ymax = region
+        stack = [node or self.root]
+        if self.vectorized:
+            while stack:
+                node = stack.pop()
+                a = node.packed()
+                if node.is_leaf:
+                    hits = (a[:, 0] >= xmin) & (a[:, 0] <= xmax) & (a[:, 1] >= ymin) & (a[:, 1] <= ymax)
+                    yield from map(node.entries.__getitem__, np.flatnonzero(hits).tolist())
+                else:
+                    hits = (a[:, 0] <= xmax) & (a[:, 2] >= xmin) & (a[:, 1] <= ymax) & (a[:, 3] >= ymin)
+                    stack.extend(map(node.entries.__getitem__, np.flatnonzero(hits)[::-1].tolist()))
+            return
+        while stack:
+            node = stack.pop()
+            if node.is_leaf:
+                for entry in node.entries:
+                    if xmin <= entry[0] <= xmax and ymin <= entry[1] <= ymax:
+                        yield entry
+            else:
+                # reversed so children come off the stack in their stored order
+                for child in reversed(node.entries):
+                    if self.intersect(child.mbr, region):
+                        stack.append(child)
+
+    async def aiter_range(self, region, yield_every=64):
+        # iter_range for asyncio code: gives the loop a turn every yield_every nodes,
+        # so cancelling the consumer stops the walk at the next turn
+        for visited, (node, hits) in enumerate(self.walk_range(region), 1):
+            if visited % yield_every == 0:
+                await asyncio.sleep(0)
+            for entry in hits:
+                yield entry
+
+    async def arange_search(self, region, yield_every=64, executor=None):
+        # with an executor the whole query runs off the loop, a cancel flag stops it partway
+        if executor is None:
+            return [entry async for entry in self.aiter_range(region, yield_every)]
+        cancelled = threading.Event()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, self.range_search_until, region, cancelled)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    def range_search_until(self, region, cancelled, check_every=64):
+        # the flag is checked every check_every nodes visited, so a query with few or no hits stops
+        # as soon after cancelling as one with many
+        results = []
+        for visited, (node, hits) in enumerate(self.walk_range(region), 1):
+            if visited % check_every == 0 and cancelled.is_set():
+                break
+            results.extend(hits)
+        return results
+
+    def walk_range(self, region, node=None):
+        # one step per node visited: (node, its matching entries), the list is empty for internal nodes;
+        # the vectorized masks cover d dimensions and rectangle leaves, so every tree shares this walk
+        stack = [node or self.root]
+        if self.vectorized:
+            d = self.dims
+            lo = np.array(region[:d], dtype=float)
+            hi = np.array(region[d:], dtype=float)
+            while stack:
+                node = stack.pop()
+                a = node.packed()
+                if node.is_leaf:
+                    if a.shape[1] == d:
+                        hits = np.all((a >= lo) & (a <= hi), axis=1)
+                    else:
+                        # RectRTree leaves pack the record MBRs
+                        hits = np.all(a[:, :d] <= hi, axis=1) & np.all(a[:, d:] >= lo, axis=1)
+                    yield node, list(map(node.entries.__getitem__, np.flatnonzero(hits).tolist()))
+                else:
+                    hits = np.all(a[:, :d] <= hi, axis=1) & np.all(a[:, d:] >= lo, axis=1)
+                    stack.extend(map(node.entries.__getitem__, np.flatnonzero(hits)[::-1].tolist()))
+                    yield node, []
+            return
+        while stack:
+            node = stack.pop()
+            if node.is_leaf:
+                yield node, [entry for entry in node.entries if self.in_region(entry, region)]
+            else:
+                stack.extend(child for child in reversed(node.entries) if self.intersect(child.mbr, region))
+                yield node, []
+
+    async def aprint_tree_level_order(self, yield_every=64):
+        queue = deque([self.root])
+        printed = 0
+        while queue:
+            node = queue.popleft()
+            printed += 1
+            if printed % yield_every == 0:
+                await asyncio.sleep(0)
+            print('Node: ' + str(node.mbr))
             for entry in node.entries:
-                if self.intersect((entry[0], entry[1], entry[0], entry[1]), region):
-                    results.append(entry)
-        else:
-            for child in node.entries:
-                if self.intersect(child.mbr, region):
-                    results.extend(self.range_search(region, child))
+                if isinstance(entry, Node):
+                    print('  ' + f'Pravougaonik: {entry.mbr}')
+                    queue.append(entry)
+                else:
+                    print('  ' + f'List: {entry}')
+
+    def range_search_many(self, regions):
+        # one traversal for the whole batch: each node is visited once with the queries that reach it
+        regions = list(regions)
+        results = [[] for _ in regions]
+        if not regions:
+            return results
+        if self.vectorized:
+            # (entries, active queries) masks over all d axes, so NDRTree and RectRTree share this path
+            d = self.dims
+            q = np.array(regions, dtype=float).reshape(-1, 2 * d)
+            stack = [(self.root, np.arange(len(regions)))]
+            while stack:
+                node, active = stack.pop()
+                a = node.packed()[:, None, :]
+                lo, hi = q[None, active, :d], q[None, active, d:]
+                if node.is_leaf:
+                    if a.shape[2] == d:
+                        hits = np.all((a >= lo) & (a <= hi), axis=2)
+                    else:
+                        # RectRTree leaves pack the record MBRs
+                        hits = np.all(a[..., :d] <= hi, axis=2) & np.all(a[..., d:] >= lo, axis=2)
+                    for i, j in zip(*np.nonzero(hits)):
+                        results[active[j]].append(node.entries[i])
+                else:
+                    hits = np.all(a[..., :d] <= hi, axis=2) & np.all(a[..., d:] >= lo, axis=2)
+                    for i in np.flatnonzero(hits.any(axis=1)):
+                        stack.append((node.entries[i], active[hits[i]]))
+            return results
+        stack = [(self.root, list(range(len(regions))))]
+        while stack:
+            node, active = stack.pop()
+            if node.is_leaf:
+                for entry in node.entries:
+                    for j in active:
+                        if self.in_region(entry, regions[j]):
+                            results[j].append(entry)
+            else:
+                for child in node.entries:
+                    reach = [j for j in active if self.intersect(child.mbr, regions[j])]
+                    if reach:
+                        stack.append((child, reach))
         return results
 
+    def count_range(self, region):
+        count = 0
+        for _ in self.iter_range(region):
+            count += 1
+        return count
+
+    def any_in_range(self, region):
+        for _ in self.iter_range(region):
+            return True
+        return False
+
+    def join(self, other, predicate='intersects'):
+        # spatial join by synchronized traversal: yields every (a, b) pair of leaf entries, a from this tree and
+        # b from other, with a intersecting, containing or lying within b; node pairs with disjoint MBRs are never
+        # opened. When the trees differ in height the leaf side waits while the other side descends.
+        if predicate not in self.PREDICATES:
+            raise ValueError(f'Unknown predicate: {predicate}')
+        if predicate == 'contains':
+            test = self.contains
+        elif predicate == 'within':
+            test = lambda ma, mb: self.contains(mb, ma)
+        else:
+            test = None  # the sweep only pairs intersecting entries
+        stack = [(self.root, other.root)]
+        while stack:
+            a, b = stack.pop()
+            if not self.intersect(a.mbr, b.mbr):
+                continue
+            if a.is_leaf and b.is_leaf:
+                for ea, eb, ma, mb in self.sweep_pairs(a, b, other):
+                    if test is None or test(ma, mb):
+                        yield ea, eb
+            elif a.is_leaf:
+                stack.extend((a, child) for child in reversed(b.entries))
+            elif b.is_leaf:
+                stack.extend((child, b) for child in reversed(a.entries))
+            else:
+                pairs = [(ca, cb) for ca, cb, _, _ in self.sweep_pairs(a, b, other)]
+                stack.extend(reversed(pairs))
+
+    def sweep_pairs(self, a, b, other):
+        # plane sweep along x over the entries of two nodes that fall inside both node MBRs:
+        # both sides sorted by xmin, each entry is paired with the other side's entries starting
+        # within its x extent, and the pair is kept if the MBRs also meet on the other axes
+        d = self.dims
+        window = tuple(map(max, a.mbr[:d], b.mbr[:d])) + tuple(map(min, a.mbr[d:], b.mbr[d:]))
+        left = sorted(((self.mbr_of(e), e) for e in a.entries), key=lambda r: r[0][0])
+        right = sorted(((other.mbr_of(e), e) for e in b.entries), key=lambda r: r[0][0])
+        left = [r for r in left if self.intersect(r[0], window)]
+        right = [r for r in right if self.intersect(r[0], window)]
+        i = j = 0
+        while i < len(left) and j < len(right):
+            if left[i][0][0] <= right[j][0][0]:
+                ma, ea = left[i]
+                k = j
+                while k < len(right) and right[k][0][0] <= ma[d]:
+                    if self.intersect(ma, right[k][0]):
+                        yield ea, right[k][1], ma, right[k][0]
+                    k += 1
+                i += 1
+            else:
+                mb, eb = right[j]
+                k = i
+                while k < len(left) and left[k][0][0] <= mb[d]:
+                    if self.intersect(left[k][0], mb):
+                        yield left[k][1], eb, left[k][0], mb
+                    k += 1
+                j += 1
+
+    def nearest(self, point, k=None):
+        # best-first: one heap of nodes and entries keyed by squared MINDIST, entries come out in distance order;
+        # a point's MBR is the point itself, so the same key ranks points, records and d-dimensional entries
+        counter = itertools.count()
+        heap = [(0, next(counter), self.root)]
+        found = 0
+        while heap and (k is None or found < k):
+            _, _, item = heapq.heappop(heap)
+            if not isinstance(item, Node):
+                found += 1
+                yield item
+            elif item.is_leaf:
+                for entry in item.entries:
+                    heapq.heappush(heap, (self.mindist(point, self.mbr_of(entry)), next(counter), entry))
+            else:
+                for child in item.entries:
+                    heapq.heappush(heap, (self.mindist(point, child.mbr), next(counter), child))
+
+    def mindist(self, point, mbr):
+        dx = max(mbr[0] - point[0], 0, point[0] - mbr[2])
+        dy = max(mbr[1] - point[1], 0, point[1] - mbr[3])
+        return dx * dx + dy * dy
+
     def intersect(self, mbr1, mbr2):
         xmin1, ymin1, xmax1, ymax1 = mbr1
         xmin2, ymin2, xmax2, ymax2 = mbr2
@@ -148,7 +1516,6 @@ class RTree:
                 if isinstance(child,Node):
                     queue.append(child)
 
-tree = RTree(4)
 # # Add some entries...
 # tree.insert((1, 2))
 # tree.insert((3, 4))
@@ -174,12 +1541,902 @@ tree = RTree(4)
 # print(tree.range_search((12, 22, 73, 62)))
 
 
-def insertData(filename,tree:RTree):
-    f = open(filename, "r")
-    for line in f:
-        lista=line.split(",")
-        tree.insert((int(lista[0]),int(lista[1])))
+class ConcurrentRTree(RTree):
+    # many readers, one writer: readers use the root that was published when they started and never lock,
+    # the writer copies every node it is about to change (path copying) and publishes a new root when done
+    def __init__(self, m, split='quadratic', vectorized=False, compact=False, payloads=False, min_fill=None,
+                 choose='area'):
+        self.write_lock = threading.Lock()
+        self.writer = None
+        self.published = None
+        self.draft = None
+        self.changed = []
+        self.copied = set()  # nodes this write owns: its copies and the nodes its splits made
+        super().__init__(m, split, vectorized, compact, payloads, min_fill, choose)
+
+    @property
+    def root(self):
+        if self.writer == threading.get_ident():
+            return self.draft
+        return self.published
+
+    @root.setter
+    def root(self, node):
+        if self.writer == threading.get_ident():
+            self.draft = node
+        else:
+            self.published = node
+
+    def write(self, operation, *args):
+        with self.write_lock:
+            self.draft = self.copy_node(self.published, None)
+            self.changed = []
+            self.copied = {self.draft}
+            self.writer = threading.get_ident()
+            try:
+                result = operation(*args)
+            finally:
+                self.writer = None
+            # a single reference assignment, readers see either the old or the new tree
+            self.published = self.draft
+            self.draft = None
+            # children the write did not touch still point at the version their parent was copied from;
+            # re-pointing them lets the superseded versions be freed once no reader holds their root.
+            # readers never follow parent links, so this is safe while they run
+            # only nodes this write owns can hold stale children, so the walk stops at the shared subtrees
+            copied, self.copied = self.copied, set()
+            stack = [self.published]
+            while stack:
+                node = stack.pop()
+                if not node.is_leaf:
+                    for child in node.entries:
+                        child.parent = node
+                        if child in copied:
+                            stack.append(child)
+            # cached regions are dropped only now: a reader that missed before this point still walked the
+            # old tree, and its put is refused because invalidate moves the cache generation on
+            changed, self.changed = self.changed, []
+            for mbr in changed:
+                super().invalidate_cache(mbr)
+            return result
+
+    def invalidate_cache(self, mbr):
+        if self.writer == threading.get_ident():
+            self.changed.append(mbr)
+        else:
+            super().invalidate_cache(mbr)
+
+    def copy_node(self, node, parent):
+        if isinstance(node.entries, PointArray):
+            entries = PointArray()
+            entries.coords = array('d', node.entries.coords)
+        else:
+            entries = list(node.entries)
+        payloads = None if node.payloads is None else node.payloads[:]
+        return Node(node.mbr, entries, node.is_leaf, parent, payloads)
+
+    def writable_child(self, node, i):
+        child = node.entries[i]
+        if child not in self.copied:
+            # still shared with the published tree
+            child = self.copy_node(child, node)
+            node.entries[i] = child
+            self.copied.add(child)
+        return child
+
+    def split(self, node, entry, payload=None):
+        if not node.is_leaf:
+            # the halves adopt the children, so children still shared with the published tree are copied first
+            node.entries = [child if child in self.copied else self.copy_node(child, node) for child in node.entries]
+            self.copied.update(node.entries)
+        halves = super().split(node, entry, payload)
+        self.copied.update(halves)
+        return halves
+
+    def find_leaf(self, point):
+        if self.writer != threading.get_ident():
+            return super().find_leaf(point)
+        # remember how each node was reached, then copy the path from the root down to the leaf
+        target = self.mbr_of(point)
+        reached = {}
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.is_leaf:
+                for i, entry in enumerate(node.entries):
+                    if self.entry_matches(entry, point):
+                        path = [node]
+                        while path[-1] is not self.root:
+                            path.append(reached[id(path[-1])])
+                        node = self.root
+                        for child in reversed(path[:-1]):
+                            node = self.writable_child(node, node.entries.index(child))
+                        return node, i
+            else:
+                for child in node.entries:
+                    if self.contains(child.mbr, target):
+                        reached[id(child)] = node
+                        stack.append(child)
+        return None, -1
+
+    def insert(self, entry, payload=None, node=None):
+        if node is None and self.writer != threading.get_ident():
+            return self.write(super().insert, entry, payload)
+        return super().insert(entry, payload, node)
+
+    def delete(self, point):
+        if self.writer != threading.get_ident():
+            return self.write(super().delete, point)
+        return super().delete(point)
+
+    def update(self, old, new):
+        if self.writer != threading.get_ident():
+            return self.write(super().update, old, new)
+        return super().update(old, new)
+
+
+class RectRTree(RTree):
+    # leaves hold (mbr, payload) records instead of points, e.g. building footprints or road segments;
+    # queries take a predicate: 'intersects', 'contains' (the record contains the region) or 'within'
+
+    def __init__(self, m, split='quadratic', vectorized=False, compact=False, min_fill=None, choose='area'):
+        if compact:
+            raise ValueError('compact leaves can only hold points')
+        super().__init__(m, split, vectorized, compact, min_fill=min_fill, choose=choose)
+
+    @classmethod
+    def from_points(cls, points, m, method='str', split='quadratic', vectorized=False, compact=False, payloads=None,
+                    **kwargs):
+        return super().from_points([cls.as_record(record) for record in points], m, method, split, vectorized, compact,
+                                   payloads, **kwargs)
+
+    @staticmethod
+    def as_record(record):
+        # the mbr is stored as a tuple, Node.packed tells record leaves from point leaves by it
+        return (tuple(record[0]),) + tuple(record[1:])
+
+    def insert(self, entry, payload=None, node=None):
+        if not isinstance(entry, Node):
+            entry = self.as_record(entry)
+        return super().insert(entry, payload, node)
+
+    def update(self, old, new):
+        return super().update(old, self.as_record(new))
+
+    def insert_rect(self, mbr, payload=None):
+        self.insert((mbr, payload))
+
+    def mbr_of(self, entry):
+        return entry.mbr if isinstance(entry, Node) else entry[0]
+
+    def entry_x(self, entry):
+        return (entry[0][0] + entry[0][2]) / 2
+
+    def entry_y(self, entry):
+        return (entry[0][1] + entry[0][3]) / 2
+
+    def entry_matches(self, entry, record):
+        return entry[0] == tuple(record[0]) and entry[1] == record[1]
+
+    def in_region(self, entry, region):
+        return self.intersect(entry[0], region)
+
+    def range_search(self, region, node=None, output='points', *, predicate='intersects'):
+        if predicate == 'intersects' or output != 'points':
+            # goes through the cache and profiler like a point query; there is no payload column,
+            # so the other outputs raise there
+            return super().range_search(region, node, output)
+        return list(self.iter_range(region, node, predicate=predicate))
+
+    def iter_range(self, region, node=None, *, predicate='intersects'):
+        if predicate not in self.PREDICATES:
+            raise ValueError(f'Unknown predicate: {predicate}')
+        xmin, ymin, xmax, ymax = region
+        # a subtree can only hold a record containing the region if its own MBR contains the region
+        prune = self.contains if predicate == 'contains' else self.intersect
+        if predicate == 'intersects':
+            test = self.intersect
+        elif predicate == 'contains':
+            test = self.contains
+        else:
+            test = lambda mbr, region: self.contains(region, mbr)
+        stack = [node or self.root]
+        while stack:
+            node = stack.pop()
+            if self.vectorized:
+                a = node.packed()
+                if node.is_leaf and predicate == 'within':
+                    hits = (a[:, 0] >= xmin) & (a[:, 1] >= ymin) & (a[:, 2] <= xmax) & (a[:, 3] <= ymax)
+                elif predicate == 'contains':
+                    hits = (a[:, 0] <= xmin) & (a[:, 1] <= ymin) & (a[:, 2] >= xmax) & (a[:, 3] >= ymax)
+                else:
+                    hits = (a[:, 0] <= xmax) & (a[:, 2] >= xmin) & (a[:, 1] <= ymax) & (a[:, 3] >= ymin)
+                if node.is_leaf:
+                    yield from map(node.entries.__getitem__, np.flatnonzero(hits).tolist())
+                else:
+                    stack.extend(map(node.entries.__getitem__, np.flatnonzero(hits)[::-1].tolist()))
+            elif node.is_leaf:
+                for entry in node.entries:
+                    if test(entry[0], region):
+                        yield entry
+            else:
+                for child in reversed(node.entries):
+                    if prune(child.mbr, region):
+                        stack.append(child)
+
+    def check_page_file(self):
+        raise ValueError('page files can only hold point trees')
+
+
+class NDRTree(RTree):
+    # d-dimensional points such as (x, y, z) or (x, y, t); MBRs and query regions are
+    # (min_0, .., min_d-1, max_0, .., max_d-1), so a box plus a time window is one region and one traversal
+    def __init__(self, m, split='quadratic', vectorized=False, compact=False, dims=3, payloads=False, min_fill=None,
+                 choose='area'):
+        if compact:
+            raise ValueError('compact leaves can only hold 2-d points')
+        self.dims = dims
+        super().__init__(m, split, vectorized, compact, payloads, min_fill, choose)
+        self.root = Node(self.empty_mbr())
+
+    def mbr_of(self, entry):
+        return entry.mbr if isinstance(entry, Node) else tuple(entry[:self.dims]) * 2
+
+    def entry_matches(self, entry, point):
+        return tuple(entry) == tuple(point)
+
+    def in_region(self, entry, region):
+        d = self.dims
+        return all(region[axis] <= entry[axis] <= region[axis + d] for axis in range(d))
+
+    # array kernels: boxes are (..., 2d) arrays, so one call covers a single MBR, every child of a node
+    # or every pair of entries; vectorized trees run all MBR arithmetic on them
+
+    def volumes(self, boxes):
+        d = self.dims
+        return np.prod(boxes[..., d:] - boxes[..., :d], axis=-1)
+
+    def margins(self, boxes):
+        d = self.dims
+        return np.sum(boxes[..., d:] - boxes[..., :d], axis=-1)
+
+    def unions(self, boxes1, boxes2):
+        d = self.dims
+        return np.concatenate((np.minimum(boxes1[..., :d], boxes2[..., :d]),
+                               np.maximum(boxes1[..., d:], boxes2[..., d:])), axis=-1)
+
+    def overlaps(self, boxes1, boxes2):
+        d = self.dims
+        sides = np.minimum(boxes1[..., d:], boxes2[..., d:]) - np.maximum(boxes1[..., :d], boxes2[..., :d])
+        return np.prod(np.maximum(sides, 0), axis=-1)
+
+    # single MBRs: the array kernels in vectorized mode, per-coordinate loops without numpy
+
+    def union(self, mbr1, mbr2):
+        if self.vectorized:
+            return tuple(self.unions(np.asarray(mbr1, dtype=float), np.asarray(mbr2, dtype=float)).tolist())
+        d = self.dims
+        return tuple(map(min, mbr1[:d], mbr2[:d])) + tuple(map(max, mbr1[d:], mbr2[d:]))
+
+    def mbr_area(self, mbr):
+        if self.vectorized:
+            return float(self.volumes(np.asarray(mbr, dtype=float)))
+        d = self.dims
+        return math.prod(hi - lo for lo, hi in zip(mbr[:d], mbr[d:]))
+
+    def margin(self, mbr):
+        if self.vectorized:
+            return float(self.margins(np.asarray(mbr, dtype=float)))
+        d = self.dims
+        return sum(hi - lo for lo, hi in zip(mbr[:d], mbr[d:]))
+
+    def area_enlargement(self, mbr, entry):
+        if self.vectorized:
+            mbr = np.asarray(mbr, dtype=float)
+            return float(self.volumes(self.unions(mbr, np.asarray(entry, dtype=float))) - self.volumes(mbr))
+        return self.mbr_area(self.union(mbr, entry)) - self.mbr_area(mbr)
+
+    def overlap_growth(self, children, i, grown):
+        if self.vectorized:
+            a = np.array([sibling.mbr for sibling in children], dtype=float)
+            growth = self.overlaps(np.asarray(grown, dtype=float), a) - self.overlaps(a[i], a)
+            return float(growth.sum() - growth[i])
+        box = children[i].mbr
+        return sum(self.overlap(grown, sibling.mbr) - self.overlap(box, sibling.mbr)
+                   for j, sibling in enumerate(children) if j != i)
+
+    def overlap(self, mbr1, mbr2):
+        if self.vectorized:
+            return float(self.overlaps(np.asarray(mbr1, dtype=float), np.asarray(mbr2, dtype=float)))
+        d = self.dims
+        volume = 1
+        for lo1, lo2, hi1, hi2 in zip(mbr1[:d], mbr2[:d], mbr1[d:], mbr2[d:]):
+            side = min(hi1, hi2) - max(lo1, lo2)
+            if side <= 0:
+                return 0
+            volume *= side
+        return volume
+
+    def quadratic_split(self, entries):
+        if not self.vectorized:
+            return super().quadratic_split(entries)
+        # RTree.quadratic_split on the array kernels: the waste of every pair in one broadcast,
+        # then the enlargements of all remaining entries per assignment
+        a = np.array([self.mbr_of(e) for e in entries], dtype=float)
+        volume = self.volumes(a)
+        waste = self.volumes(self.unions(a[:, None], a[None, :])) - volume[:, None] - volume[None, :]
+        waste[np.tril_indices(len(entries))] = -np.inf
+        i, j = np.unravel_index(np.argmax(waste), waste.shape)
+        g1, g2 = [int(i)], [int(j)]
+        m1, m2 = a[i], a[j]
+        rest = np.array([k for k in range(len(entries)) if k != i and k != j])
+        while rest.size:
+            if len(g1) + rest.size <= self.min_fill:
+                g1.extend(rest.tolist())
+                break
+            if len(g2) + rest.size <= self.min_fill:
+                g2.extend(rest.tolist())
+                break
+            v1, v2 = self.volumes(m1), self.volumes(m2)
+            d1 = self.volumes(self.unions(m1, a[rest])) - v1
+            d2 = self.volumes(self.unions(m2, a[rest])) - v2
+            k = int(np.argmax(np.abs(d1 - d2)))
+            best = int(rest[k])
+            rest = np.delete(rest, k)
+            if (d1[k], v1, len(g1)) <= (d2[k], v2, len(g2)):
+                g1.append(best)
+                m1 = self.unions(m1, a[best])
+            else:
+                g2.append(best)
+                m2 = self.unions(m2, a[best])
+        return [entries[k] for k in g1], [entries[k] for k in g2]
+
+    def rstar_split(self, entries):
+        if not self.vectorized:
+            return super().rstar_split(entries)
+        # RTree.rstar_split on the array kernels: running min/max along each sorting gives the MBRs
+        # of every distribution at once
+        d = self.dims
+        a = np.array([self.mbr_of(e) for e in entries], dtype=float)
+        cuts = np.arange(self.min_fill, len(entries) - self.min_fill + 1)
+        best_axis = None
+        for axis in range(d):
+            margin = 0
+            sortings = []
+            for bound in (axis, axis + d):
+                order = np.argsort(a[:, bound], kind='stable')
+                s = a[order]
+                head = np.concatenate((np.minimum.accumulate(s[:, :d]), np.maximum.accumulate(s[:, d:])), axis=1)
+                tail = np.concatenate((np.minimum.accumulate(s[::-1, :d])[::-1],
+                                       np.maximum.accumulate(s[::-1, d:])[::-1]), axis=1)
+                left, right = head[cuts - 1], tail[cuts]
+                sortings.append((order, left, right))
+                margin += self.margins(left).sum() + self.margins(right).sum()
+            if best_axis is None or margin < best_axis[0]:
+                best_axis = (margin, sortings)
+        orders, lefts, rights = zip(*best_axis[1])
+        left, right = np.concatenate(lefts), np.concatenate(rights)
+        # least overlap, then least total volume; lexsort is stable, so ties keep the first distribution
+        best = int(np.lexsort((self.volumes(left) + self.volumes(right), self.overlaps(left, right)))[0])
+        order = orders[best // len(cuts)].tolist()
+        i = int(cuts[best % len(cuts)])
+        return [entries[k] for k in order[:i]], [entries[k] for k in order[i:]]
+
+    def intersect(self, mbr1, mbr2):
+        d = self.dims
+        return all(lo1 <= hi2 and lo2 <= hi1 for lo1, hi1, lo2, hi2 in zip(mbr1[:d], mbr1[d:], mbr2[:d], mbr2[d:]))
+
+    def contains(self, outer, inner):
+        d = self.dims
+        return all(o <= i for o, i in zip(outer[:d], inner[:d])) and all(i <= o for o, i in zip(outer[d:], inner[d:]))
+
+    def compute_mbr(self, entries):
+        # one pass to collect the MBRs, transposed into per-bound columns for min/max
+        columns = list(zip(*map(self.mbr_of, entries)))
+        d = self.dims
+        return tuple(map(min, columns[:d])) + tuple(map(max, columns[d:]))
+
+    def mindist(self, point, mbr):
+        d = self.dims
+        return sum(max(mbr[axis] - point[axis], 0, point[axis] - mbr[axis + d]) ** 2 for axis in range(d))
+
+    def union_area(self, mbrs, axis=0):
+        # volume of the union: slabs along one axis, recursing into the boxes spanning each slab
+        d = self.dims
+        if axis == d - 1:
+            covered = 0
+            top = float('-inf')
+            for lo, hi in sorted((m[axis], m[axis + d]) for m in mbrs):
+                if hi > top:
+                    covered += hi - max(lo, top)
+                    top = hi
+            return covered
+        edges = sorted({x for m in mbrs for x in (m[axis], m[axis + d])})
+        total = 0
+        for x1, x2 in zip(edges, edges[1:]):
+            slab = [m for m in mbrs if m[axis] <= x1 and m[axis + d] >= x2]
+            if slab:
+                total += (x2 - x1) * self.union_area(slab, axis + 1)
+        return total
+
+    def choose_subtree(self, node, entry_mbr):
+        if self.choose_policy == 'rstar' and node.entries[0].is_leaf:
+            return self.rstar_choose_subtree(node, entry_mbr)
+        if self.vectorized:
+            # all children of the node at once
+            a = node.packed()
+            volume = self.volumes(a)
+            grown = self.volumes(self.unions(a, np.array(entry_mbr, dtype=float)))
+            # least enlargement, ties go to the smaller child
+            return int(np.lexsort((volume, grown - volume))[0])
+        best = None
+        for i, child in enumerate(node.entries):
+            volume = child.area()
+            key = (self.mbr_area(self.union(child.mbr, entry_mbr)) - volume, volume)
+            if best is None or key < best[0]:
+                best = (key, i)
+        return best[1]
+
+    def iter_range(self, region, node=None):
+        d = self.dims
+        lo, hi = region[:d], region[d:]
+        stack = [node or self.root]
+        if self.vectorized:
+            qlo = np.array(lo, dtype=float)
+            qhi = np.array(hi, dtype=float)
+            while stack:
+                node = stack.pop()
+                a = node.packed()
+                if node.is_leaf:
+                    hits = np.all((a >= qlo) & (a <= qhi), axis=1)
+                    yield from map(node.entries.__getitem__, np.flatnonzero(hits).tolist())
+                else:
+                    hits = np.all(a[:, :d] <= qhi, axis=1) & np.all(a[:, d:] >= qlo, axis=1)
+                    stack.extend(map(node.entries.__getitem__, np.flatnonzero(hits)[::-1].tolist()))
+            return
+        while stack:
+            node = stack.pop()
+            if node.is_leaf:
+                for entry in node.entries:
+                    if all(l <= c <= h for l, c, h in zip(lo, entry, hi)):
+                        yield entry
+            else:
+                for child in reversed(node.entries):
+                    if self.intersect(child.mbr, region):
+                        stack.append(child)
+
+    def str_pack(self, items, key_x=None, key_y=None):
+        # STR over all d axes: slabs along axis 0, each cut into slabs along axis 1, and so on
+        m = self.limit
+        d = self.dims
+
+        def centre(item, axis):
+            b = self.mbr_of(item)
+            return b[axis] + b[axis + d]
+
+        def tile(items, axis):
+            items = sorted(items, key=lambda item: centre(item, axis))
+            if axis == d - 1 or len(items) <= m:
+                return [items[i:i + m] for i in range(0, len(items), m)]
+            pages = math.ceil(len(items) / m)
+            slab = math.ceil(pages / math.ceil(pages ** (1 / (d - axis)))) * m
+            groups = []
+            for i in range(0, len(items), slab):
+                groups.extend(tile(items[i:i + slab], axis + 1))
+            return groups
+
+        return tile(items, 0)
+
+    def hilbert_pack(self, items, key, order=16):
+        raise ValueError('Hilbert packing is only implemented for 2-d trees')
+
+    def check_page_file(self):
+        raise ValueError('page files can only hold 2-d point trees')
+
+
+class HilbertRTree(RTree):
+    # dynamic Hilbert R-tree (Kamel & Faloutsos): leaves keep their points in Hilbert order and every
+    # node knows the largest Hilbert value (LHV) below each child; an insert goes to the first child
+    # whose LHV is not smaller than the point's. A full node first shares its entries with a neighbour
+    # that has room, and only when both are full are the two split into three (2-to-3 split),
+    # so nodes stay about 2/3 full or more without rebuilds. bounds is the area mapped onto the curve,
+    # points outside it are clamped to its edge.
+    def __init__(self, m, bounds, vectorized=False, compact=False, payloads=False, min_fill=None, order=16):
+        super().__init__(m, 'sort', vectorized, compact, payloads, min_fill)
+        self.bounds = tuple(bounds)
+        self.order = order
+        self.root.keys = []
+
+    @classmethod
+    def from_points(cls, points, m, bounds=None, vectorized=False, compact=False, payloads=None, min_fill=None,
+                    order=16):
+        # full leaves in Hilbert order, later inserts share into their neighbours
+        points = list(points)
+        if bounds is None and points:
+            xs = [p[0] for p in points]
+            ys = [p[1] for p in points]
+            bounds = (min(xs), min(ys), max(xs), max(ys))
+        tree = cls(m, bounds or (0, 0, 1, 1), vectorized, compact, payloads is not None, min_fill, order)
+        if not points:
+            return tree
+        if payloads is None:
+            payloads = [None] * len(points)
+        for payload in payloads:
+            tree.check_payload(payload)
+        records = sorted(zip((tree.hilbert_key(tree.mbr_of(p)) for p in points), range(len(points))))
+        level = []
+        for group in tree.fill_groups([records[i:i + m] for i in range(0, len(records), m)]):
+            group_points = [points[i] for _, i in group]
+            leaf = tree.make_leaf(tree.compute_mbr(group_points), group_points, [payloads[i] for _, i in group])
+            leaf.keys = [h for h, _ in group]
+            level.append(leaf)
+        while len(level) > 1:
+            parents = []
+            for group in tree.fill_groups([level[i:i + m] for i in range(0, len(level), m)]):
+                parent = Node(tree.compute_mbr(group), group, False)
+                parent.keys = [child.keys[-1] for child in group]
+                for child in group:
+                    child.parent = parent
+                parents.append(parent)
+            level = parents
+        tree.root = level[0]
+        return tree
+
+    def hilbert_key(self, mbr):
+        xmin, ymin, xmax, ymax = self.bounds
+        side = (1 << self.order) - 1
+        x = min(side, max(0, int(((mbr[0] + mbr[2]) / 2 - xmin) / ((xmax - xmin) or 1) * side)))
+        y = min(side, max(0, int(((mbr[1] + mbr[3]) / 2 - ymin) / ((ymax - ymin) or 1) * side)))
+        return hilbert_value(x, y, self.order)
+
+    def insert(self, entry, payload=None, node=None):
+        if node is None:
+            if self.profiler is not None and self.profiler.active is None:
+                return self.profiled_insert(entry, payload)
+            self.check_payload(payload)
+            node = self.root
+            self.invalidate_cache(self.mbr_of(entry))
+        entry_mbr = self.mbr_of(entry)
+        h = self.hilbert_key(entry_mbr)
+        while not node.is_leaf:
+            if not node.entries:
+                # empty root
+                leaf = self.make_leaf(entry_mbr, [entry], [payload], node)
+                leaf.keys = [h]
+                node.entries.append(leaf)
+                node.keys = [h]
+                node.arrays = None
+                self.widen_path(node, entry_mbr)
+                return
+            if self.profiler is not None:
+                self.profiler.count('path_length')
+            node = self.writable_child(node, min(bisect.bisect_left(node.keys, h), len(node.keys) - 1))
+        i = bisect.bisect_right(node.keys, h)
+        node.entries.insert(i, entry)
+        node.keys.insert(i, h)
+        if node.payloads is not None:
+            node.payloads.insert(i, payload)
+        node.arrays = None
+        self.widen_path(node, entry_mbr)
+        self.raise_lhv(node)
+        if len(node.entries) > self.limit:
+            self.overflow(node)
+
+    def raise_lhv(self, node):
+        # pass a grown LHV up until a parent already has it
+        while node.parent is not None:
+            parent = node.parent
+            i = parent.entries.index(node)
+            if parent.keys[i] == node.keys[-1]:
+                return
+            parent.keys[i] = node.keys[-1]
+            node = parent
+
+    def overflow(self, node):
+        # deferred splitting: share with a neighbour that has room, else split the full pair 2-to-3;
+        # a parent that gains a child may overflow in turn
+        while len(node.entries) > self.limit:
+            if node.parent is None:
+                self.root = Node(node.mbr, [node], False)
+                self.root.keys = [node.keys[-1]]
+                node.parent = self.root
+            parent = node.parent
+            i = parent.entries.index(node)
+            for j in (i + 1, i - 1):
+                if 0 <= j < len(parent.entries) and len(parent.entries[j].entries) < self.limit:
+                    self.share(parent, min(i, j), 2)
+                    return
+            if len(parent.entries) == 1:
+                # an only child is split in two
+                first, count = i, 1
+            else:
+                first, count = (i if i + 1 < len(parent.entries) else i - 1), 2
+            if self.profiler is not None:
+                self.profiler.count('splits')
+            new = Node(None, [], node.is_leaf, parent)
+            new.keys = []
+            if node.is_leaf:
+                new.entries = self.leaf_entries([])
+                if self.payloads:
+                    new.payloads = self.leaf_payloads([])
+            parent.entries.insert(first + count, new)
+            parent.keys.insert(first + count, parent.keys[first + count - 1])
+            self.share(parent, first, count + 1)
+            node = parent
+
+    def share(self, parent, first, count, into=None):
+        # spread the entries of parent.entries[first:first + count] evenly over the first `into` of them,
+        # keeping Hilbert order; the parent's MBR does not change, its keys and the nodes' MBRs do
+        nodes = parent.entries[first:first + count]
+        into = into or count
+        entries = [e for n in nodes for e in n.entries]
+        keys = [k for n in nodes for k in n.keys]
+        payloads = [p for n in nodes for p in n.payloads] if nodes[0].payloads is not None else None
+        start = 0
+        for k, n in enumerate(nodes[:into]):
+            end = start + (len(entries) - start) // (into - k)
+            if n.is_leaf:
+                n.entries = self.leaf_entries(entries[start:end])
+                if payloads is not None:
+                    n.payloads = self.leaf_payloads(payloads[start:end])
+            else:
+                n.entries = entries[start:end]
+                for child in n.entries:
+                    child.parent = n
+            n.keys = keys[start:end]
+            n.mbr = self.compute_mbr(n.entries)
+            n.touch()
+            parent.keys[first + k] = n.keys[-1]
+            start = end
+
+    def remove_entry(self, leaf, index):
+        del leaf.keys[index]
+        return super().remove_entry(leaf, index)
+
+    def condense_tree(self, node):
+        # an underfull node borrows from a neighbour, or merges with it when the two together
+        # are too few for two nodes; merging can leave the parent underfull in turn
+        while node.parent is not None:
+            parent = node.parent
+            i = parent.entries.index(node)
+            if len(node.entries) < self.min_fill and len(parent.entries) > 1:
+                first = i if i + 1 < len(parent.entries) else i - 1
+                pair = parent.entries[first:first + 2]
+                if len(pair[0].entries) + len(pair[1].entries) >= 2 * self.min_fill:
+                    self.share(parent, first, 2)
+                else:
+                    self.share(parent, first, 2, 1)
+                    del parent.entries[first + 1]
+                    del parent.keys[first + 1]
+            elif not node.entries:
+                # an empty only child, possible with min_fill=1
+                del parent.entries[i]
+                del parent.keys[i]
+                parent.touch()
+            else:
+                node.mbr = self.compute_mbr(node.entries) if node.entries else self.empty_mbr()
+                node.touch()
+                if node.keys:
+                    parent.keys[i] = node.keys[-1]
+            node = parent
+        node.mbr = self.compute_mbr(node.entries) if node.entries else self.empty_mbr()
+        node.touch()
+
+    def update(self, old, new):
+        # the Hilbert value fixes where a point is stored, so a moved point is deleted and inserted again
+        leaf, index = self.find_leaf(old)
+        if leaf is None:
+            return False
+        payload = leaf.payloads[index] if leaf.payloads is not None else None
+        self.delete(old)
+        self.insert(new, payload)
+        return True
+
+    def check_invariants(self):
+        # RTree's checks plus Hilbert order: keys sorted and aligned with the entries, each parent key the LHV below it
+        report = super().check_invariants()
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if len(node.keys) != len(node.entries) or node.keys != sorted(node.keys):
+                raise ValueError('Hilbert keys of a node are out of order or out of step with its entries')
+            if not node.is_leaf:
+                for key, child in zip(node.keys, node.entries):
+                    if child.keys and key != child.keys[-1]:
+                        raise ValueError(f'parent key {key} is not the LHV {child.keys[-1]} of its child')
+                stack.extend(node.entries)
+        return report
+
+    def save(self, path, page_size=None):
+        raise ValueError('page files do not store Hilbert values')
+
+
+worker_shards = None  # shard trees opened by each worker process
+
+
+def open_shards(paths):
+    global worker_shards
+    worker_shards = [RTree.load(path) for path in paths]
+
+
+def search_shard(index, region):
+    return worker_shards[index].range_search(region)
+
+
+def count_shard(index, region):
+    return worker_shards[index].count_range(region)
+
+
+class ParallelRTree:
+    # splits the tree under the root into shards, saves each as a page file and lets a process pool
+    # query them; workers mmap the files, so they share one copy of the index through the page cache.
+    # The shards are a snapshot: inserts, deletes and updates on tree after construction are not seen
+    def __init__(self, tree, workers=None, directory=None):
+        # shards are plain page files, so a tree that save rejects is rejected here with the same error
+        tree.check_page_file()
+        workers = workers or os.cpu_count() or 1
+        self.owns_directory = directory is None
+        self.directory = directory or tempfile.mkdtemp(prefix='rtree-shards-')
+        try:
+            self.open(tree, workers)
+        except BaseException:
+            if self.owns_directory:
+                shutil.rmtree(self.directory, ignore_errors=True)
+            raise
+
+    def open(self, tree, workers):
+        if tree.root.is_leaf:
+            groups = [[tree.root]]
+        else:
+            # greedy balance of the root's subtrees by point count
+            groups = [[] for _ in range(min(workers, len(tree.root.entries)) or 1)]
+            sizes = [0] * len(groups)
+            subtrees = sorted(tree.root.entries, key=lambda child: -sum(1 for _ in tree.iter_points(child)))
+            for child in subtrees:
+                i = sizes.index(min(sizes))
+                groups[i].append(child)
+                sizes[i] += sum(1 for _ in tree.iter_points(child))
+        self.tree = tree
+        self.mbrs = []
+        paths = []
+        for i, group in enumerate(groups):
+            shard = RTree(tree.limit, tree.split_policy)
+            if group and group[0] is not tree.root:
+                shard.root = Node(tree.compute_mbr(group), list(group), False)
+            else:
+                shard.root = tree.root
+            path = os.path.join(self.directory, f'shard{i}.rtp')
+            shard.save(path)
+            paths.append(path)
+            self.mbrs.append(shard.root.mbr)
+        self.pool = ProcessPoolExecutor(len(paths), initializer=open_shards, initargs=(paths,))
+
+    def shards_for(self, region):
+        return [i for i, mbr in enumerate(self.mbrs) if self.tree.intersect(mbr, region)]
+
+    def range_search(self, region):
+        results = []
+        for part in [self.pool.submit(search_shard, i, region) for i in self.shards_for(region)]:
+            results.extend(part.result())
+        return results
+
+    def count_range(self, region):
+        return sum(f.result() for f in [self.pool.submit(count_shard, i, region) for i in self.shards_for(region)])
+
+    def range_search_many(self, regions):
+        # every query goes to its shards at once, so the whole batch keeps all workers busy
+        regions = list(regions)
+        futures = [[self.pool.submit(search_shard, i, region) for i in self.shards_for(region)] for region in regions]
+        results = []
+        for parts in futures:
+            merged = []
+            for part in parts:
+                merged.extend(part.result())
+            results.append(merged)
+        return results
+
+    def close(self):
+        self.pool.shutdown()
+        if self.owns_directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def parse_points(text, with_ids=False):
+    # "x,y[,id,...]" lines -> list of (x, y) or (x, y, id) tuples, extra columns are ignored
+    lines = [line for line in text.splitlines() if line.strip()]
+    if not lines:
+        return []
+    # every line must have as many columns as the first, a ragged line would shift all values after it
+    cols = lines[0].count(',') + 1
+    for line in lines:
+        if line.count(',') + 1 != cols:
+            raise ValueError(f'expected {cols} comma separated values on every line, got {line!r}')
+    if cols < 2:
+        raise ValueError(f'expected comma separated "x,y" lines, got {lines[0]!r}')
+    if with_ids and cols < 3:
+        raise ValueError('with_ids needs an id in the third column')
+    if np is not None:
+        try:
+            values = np.fromstring(' '.join(lines).replace(',', ' '), sep=' ')
+        except ValueError:
+            values = None
+    # a column that is not a number goes to the line by line parser below, which ignores the extra
+    # columns and raises ValueError if x, y or the id is the culprit
+    if np is not None and values is not None and values.size == len(lines) * cols:
+        values = values.reshape(-1, cols)
+        if with_ids:
+            # ids are parsed as integers, float64 would round the ones above 2**53
+            ids = [int(line.split(',', 3)[2]) for line in lines]
+            return list(zip(values[:, 0].tolist(), values[:, 1].tolist(), ids))
+        return list(zip(values[:, 0].tolist(), values[:, 1].tolist()))
+    points = []
+    for line in lines:
+        lista = line.split(",")
+        if with_ids:
+            points.append((float(lista[0]), float(lista[1]), int(lista[2])))
+        else:
+            points.append((float(lista[0]), float(lista[1])))
+    return points
+
+
+def read_points(filename, chunk_size=1 << 22, with_ids=False):
+    # reads the file in large chunks and yields one parsed batch of points per chunk
+    with open(filename, "r") as f:
+        rest = ''
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            chunk = rest + chunk
+            cut = chunk.rfind('\n') + 1
+            rest = chunk[cut:]
+            if cut:
+                yield parse_points(chunk[:cut], with_ids)
+        if rest.strip():
+            yield parse_points(rest, with_ids)
+
+
+def throughput(points, start):
+    seconds = time.perf_counter() - start
+    return {'points': points, 'seconds': seconds, 'points_per_second': points / seconds if seconds else float('inf')}
+
+
+def insertData(filename,tree:RTree, chunk_size=1 << 22, with_ids=False):
+    # with ids and a payload tree the ids go into the payload column
+    start = time.perf_counter()
+    count = 0
+    for batch in read_points(filename, chunk_size, with_ids):
+        for point in batch:
+            if with_ids and tree.payloads:
+                tree.insert(point[:2], point[2])
+            else:
+                tree.insert(point)
+        count += len(batch)
+    return throughput(count, start)
+
+
+def loadData(filename, m, method='str', chunk_size=1 << 22, with_ids=False, payloads=False, **kwargs):
+    # bulk load variant of insertData, returns the tree and the ingest throughput;
+    # with_ids and payloads put the ids in the payload column instead of the point tuples
+    start = time.perf_counter()
+    points = []
+    for batch in read_points(filename, chunk_size, with_ids):
+        points.extend(batch)
+    if with_ids and payloads:
+        kwargs['payloads'] = [p[2] for p in points]
+        points = [p[:2] for p in points]
+    tree = RTree.from_points(points, m, method, **kwargs)
+    return tree, throughput(len(points), start)
+
 
-insertData("dokument.txt",tree)
-tree.print_tree_level_order()
-print(tree.range_search((7, 0, 9, 9)))
\ No newline at end of file
+if __name__ == '__main__':
+    tree = RTree(4)
+    insertData("dokument.txt",tree)
+    tree.print_tree_level_order()
+    print(tree.range_search((7, 0, 9, 9)))
@@ -0,0 +1,248 @@
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import baze2Proj
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+EXTENT = 1000000.0
+SELECTIVITIES = (0.0001, 0.001, 0.01)
+
+
+def load_variant(filename):
+    # the older variants run a demo at import time and some of them crash in it;
+    # the classes are defined before the demo, so keep whatever the module got to define
+    namespace = {'__name__': 'variant_' + os.path.splitext(filename)[0].replace(' ', '_')}
+    with open(os.path.join(HERE, filename)) as f:
+        code = compile(f.read(), filename, 'exec')
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            exec(code, namespace)
+        except Exception:
+            pass
+    return namespace
+
+
+# datasets
+
+def uniform(n, rnd):
+    return [(rnd.uniform(0, EXTENT), rnd.uniform(0, EXTENT)) for _ in range(n)]
+
+
+def clustered(n, rnd):
+    # Gaussian blobs with a spread of 1% of the extent
+    centers = [(rnd.uniform(0, EXTENT), rnd.uniform(0, EXTENT)) for _ in range(max(10, n // 10000))]
+    sigma = EXTENT * 0.01
+    points = []
+    for _ in range(n):
+        cx, cy = rnd.choice(centers)
+        points.append((min(max(rnd.gauss(cx, sigma), 0), EXTENT), min(max(rnd.gauss(cy, sigma), 0), EXTENT)))
+    return points
+
+
+def line(n, rnd):
+    y = EXTENT / 2
+    return [(rnd.uniform(0, EXTENT), y + rnd.gauss(0, EXTENT * 0.001)) for _ in range(n)]
+
+
+def diagonal(n, rnd):
+    points = []
+    for _ in range(n):
+        t = rnd.uniform(0, EXTENT)
+        points.append((t, min(max(t + rnd.gauss(0, EXTENT * 0.001), 0), EXTENT)))
+    return points
+
+
+DATASETS = {'uniform': uniform, 'clustered': clustered, 'line': line, 'diagonal': diagonal}
+
+
+def make_queries(points, selectivity, count, rnd):
+    # squares covering `selectivity` of the extent, centred on data points so they are not all empty
+    half = math.sqrt(selectivity) * EXTENT / 2
+    queries = []
+    for _ in range(count):
+        x, y = rnd.choice(points)
+        queries.append((x - half, y - half, x + half, y + half))
+    return queries
+
+
+# engines: name -> (build(points, m), insert(tree, point), query(tree, region) or None, legacy)
+# a new engine only has to be added here
+
+def insert_all(tree, points, insert):
+    for p in points:
+        insert(tree, p)
+    return tree
+
+
+def baze2_engine(**kwargs):
+    def build(points, m):
+        return insert_all(baze2Proj.RTree(m, **kwargs), points, lambda t, p: t.insert(p))
+    return build, lambda t, p: t.insert(p), lambda t, r: t.range_search(r), False
+
+
+def bulk_engine(method, **kwargs):
+    def build(points, m):
+        return baze2Proj.RTree.from_points(points, m, method, **kwargs)
+    return build, lambda t, p: t.insert(p), lambda t, r: t.range_search(r), False
+
+
+def hilbert_engine(**kwargs):
+    # dynamic Hilbert R-tree, every point goes in through insert
+    def build(points, m):
+        return insert_all(baze2Proj.HilbertRTree(m, (0, 0, EXTENT, EXTENT), **kwargs), points, lambda t, p: t.insert(p))
+    return build, lambda t, p: t.insert(p), lambda t, r: t.range_search(r), False
+
+
+def legacy_engines():
+    engines = {}
+    aaaaaaa = load_variant('aaaaaaa.py')
+    engines['aaaaaaa'] = (lambda points, m: insert_all(aaaaaaa['RTree'](), points, lambda t, p: t.insert(p)),
+                          lambda t, p: t.insert(p), None, True)
+    nebalansirani = load_variant('nebalansiraniRTree.py')
+    engines['nebalansiraniRTree'] = (
+        lambda points, m: insert_all(nebalansirani['RTree'](), points, lambda t, p: t.insert(p)),
+        lambda t, p: t.insert(p), lambda t, r: t.range_search(r), True)
+    balansirani = load_variant('pokusaj balansiranog.py')
+    engines['pokusaj balansiranog'] = (
+        lambda points, m: insert_all(balansirani['RTree'](max(1, m // 2), m), points, lambda t, p: t.insert(p)),
+        lambda t, p: t.insert(p), lambda t, r: t.range_search(t.root, r), True)
+    osjecaj = load_variant('neki osjecaj.py')
+    engines['neki osjecaj'] = (
+        lambda points, m: insert_all(osjecaj['RTree'](max(1, m // 2), m), points, lambda t, p: t.Insert(p)),
+        lambda t, p: t.Insert(p), lambda t, r: t.RangeSearch(t.root, r), True)
+    return engines
+
+
+def make_engines():
+    engines = {
+        'baze2Proj-sort': baze2_engine(split='sort'),
+        'baze2Proj-linear': baze2_engine(split='linear'),
+        'baze2Proj-quadratic': baze2_engine(split='quadratic'),
+        'baze2Proj-rstar': baze2_engine(split='rstar'),
+        'baze2Proj-str': bulk_engine('str'),
+        'baze2Proj-hilbert': bulk_engine('hilbert'),
+        'baze2Proj-str-compact': bulk_engine('str', compact=True),
+        'baze2Proj-hilbert-dynamic': hilbert_engine(),
+    }
+    if baze2Proj.np is not None:
+        engines['baze2Proj-str-vectorized'] = bulk_engine('str', vectorized=True)
+    engines.update(legacy_engines())
+    return engines
+
+
+# measurements
+
+def tree_height(tree):
+    height = 0
+    node = tree.root
+    while node is not None:
+        height += 1
+        leaf = node.is_leaf() if callable(node.is_leaf) else node.is_leaf
+        children = getattr(node, 'children', None) or [e for e in node.entries if hasattr(e, 'mbr') and hasattr(e, 'entries')]
+        node = children[0] if children and not leaf else None
+    return height
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def run_one(name, engine, dataset, points, extra, queries, m, memory_limit):
+    build, insert, query, _ = engine
+    row = {'engine': name, 'dataset': dataset, 'size': len(points), 'node_size': m}
+    try:
+        start = time.perf_counter()
+        tree = build(points, m)
+        row['build_seconds'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for p in extra:
+            insert(tree, p)
+        seconds = time.perf_counter() - start
+        row['inserts_per_second'] = len(extra) / seconds if seconds else None
+        row['height'] = tree_height(tree)
+
+        # memory_bytes is the tracemalloc peak of a fresh build for every engine, so rows compare;
+        # baze2Proj's own estimate is kept apart under memory_estimate_bytes
+        if hasattr(tree, 'memory_usage'):
+            row['memory_estimate_bytes'] = tree.memory_usage()['total_bytes']
+        if len(points) <= memory_limit:
+            tracemalloc.start()
+            build(points, m)
+            row['memory_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        if query is not None:
+            everything = points + extra
+            row['queries'] = {}
+            for selectivity, regions in queries.items():
+                latencies = []
+                found = 0
+                for region in regions:
+                    start = time.perf_counter()
+                    found += len(query(tree, region))
+                    latencies.append(time.perf_counter() - start)
+                region = regions[0]
+                expected = sum(1 for p in everything if region[0] <= p[0] <= region[2] and region[1] <= p[1] <= region[3])
+                row['queries'][str(selectivity)] = {
+                    'p50': percentile(latencies, 50), 'p95': percentile(latencies, 95), 'p99': percentile(latencies, 99),
+                    'mean_results': found / len(regions), 'correct': len(query(tree, region)) == expected}
+    except Exception as e:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        row['error'] = f'{type(e).__name__}: {e}'
+    return row
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build and query every RTree variant on synthetic data, write JSON.')
+    parser.add_argument('--sizes', default='1000,10000', help='comma separated point counts, e.g. 1000,10000,100000')
+    parser.add_argument('--datasets', default=','.join(DATASETS))
+    parser.add_argument('--engines', default=None, help='comma separated engine names, default all')
+    parser.add_argument('--node-size', type=int, default=16)
+    parser.add_argument('--queries', type=int, default=100, help='queries per selectivity')
+    parser.add_argument('--legacy-max', type=int, default=1000, help='largest size run on the older variants')
+    parser.add_argument('--memory-max', type=int, default=100000, help='largest size measured with tracemalloc')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='bench_results.json')
+    args = parser.parse_args(argv)
+
+    engines = make_engines()
+    if args.engines:
+        engines = {name: engines[name] for name in args.engines.split(',')}
+    results = []
+    for dataset in args.datasets.split(','):
+        for size in map(int, args.sizes.split(',')):
+            rnd = random.Random(args.seed)
+            points = DATASETS[dataset](size, rnd)
+            extra = DATASETS[dataset](max(100, min(1000, size // 10)), rnd)
+            queries = {s: make_queries(points, s, args.queries, rnd) for s in SELECTIVITIES}
+            for name, engine in engines.items():
+                if engine[3] and size > args.legacy_max:
+                    continue
+                row = run_one(name, engine, dataset, points, extra, queries, args.node_size, args.memory_max)
+                results.append(row)
+                print(f"{dataset:10} {size:>9} {name:28} build {row.get('build_seconds', float('nan')):8.3f}s"
+                      f"  height {row.get('height', '-')}  {row.get('error', '')}")
+
+    report = {'meta': {'python': platform.python_version(), 'platform': platform.platform(), 'seed': args.seed,
+                       'node_size': args.node_size, 'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+              'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == '__main__':
+    main()
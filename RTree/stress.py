@@ -0,0 +1,77 @@
+import argparse
+from collections import Counter
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import baze2Proj
+
+
+def height_bound(points, min_fill):
+    # every non-root node keeps min_fill entries, so n points need at most log_min_fill(n) levels
+    # below the root, plus the root and its possible single child
+    return math.ceil(math.log(max(points, 2), max(min_fill, 2))) + 2
+
+
+def check(tree, points, label, rnd, queries=5):
+    report = tree.check_invariants()
+    if report['points'] != len(points):
+        raise ValueError(f'{label}: tree holds {report["points"]} points, expected {len(points)}')
+    bound = height_bound(len(points), tree.min_fill)
+    if report['height'] > bound:
+        raise ValueError(f'{label}: height {report["height"]} is over the bound {bound}')
+    # the structure can be valid while the wrong points are in it, so compare a few queries with a scan
+    for _ in range(queries):
+        x, y = rnd.uniform(0, 900), rnd.uniform(0, 900)
+        region = (x, y, x + rnd.uniform(0, 100), y + rnd.uniform(0, 100))
+        expected = Counter(p for p in points if region[0] <= p[0] <= region[2] and region[1] <= p[1] <= region[3])
+        if Counter(tree.range_search(region)) != expected:
+            raise ValueError(f'{label}: range_search{region} does not match the inserted points')
+    return report
+
+
+def run(split, args):
+    rnd = random.Random(args.seed)
+    # the query regions have their own generator, so checking does not change the inserted points
+    queries = random.Random(args.seed + 1)
+    if split == 'hilbert':
+        tree = baze2Proj.HilbertRTree(args.node_size, (0, 0, 1000, 1000), min_fill=args.min_fill)
+    else:
+        tree = baze2Proj.RTree(args.node_size, split, min_fill=args.min_fill)
+    points = []
+    start = time.perf_counter()
+    for i in range(1, args.inserts + 1):
+        p = (rnd.uniform(0, 1000), rnd.uniform(0, 1000))
+        tree.insert(p)
+        points.append(p)
+        if args.delete_every and i % args.delete_every == 0:
+            q = points.pop(rnd.randrange(len(points)))
+            if not tree.delete(q):
+                raise ValueError(f'{split}: lost {q} after {i} inserts')
+        if i % args.check_every == 0 or i == args.inserts:
+            report = check(tree, points, f'{split} after {i} inserts', queries)
+            print(f'{split:10} {i:>9} inserts  {len(points):>9} points  height {report["height"]}'
+                  f'  nodes {report["nodes"]}  {time.perf_counter() - start:8.1f}s')
+    return tree
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Random inserts and deletes with periodic checks of the tree invariants.')
+    parser.add_argument('--inserts', type=int, default=1000000)
+    parser.add_argument('--node-size', type=int, default=16, help='m, the most entries a node holds')
+    parser.add_argument('--min-fill', type=int, default=None, help='fewest entries of a non-root node, default 40%% of m')
+    parser.add_argument('--splits', default=','.join(baze2Proj.RTree.SPLIT_POLICIES + ('hilbert',)),
+                        help='split policies to run, hilbert runs the dynamic HilbertRTree')
+    parser.add_argument('--delete-every', type=int, default=10, help='delete a random point every N inserts, 0 to never')
+    parser.add_argument('--check-every', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+    for split in args.splits.split(','):
+        run(split, args)
+
+
+if __name__ == '__main__':
+    main()